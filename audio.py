@@ -0,0 +1,188 @@
+# Audio decoding to 16 kHz mono float32, the input Whisper expects.
+# WAV is parsed and resampled in-process. Other formats are decoded in-process by PyAV when it is installed,
+# and only fall back to an ffmpeg subprocess (through a temporary file) without it.
+
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import os
+import shutil
+import struct
+import tempfile
+
+import numpy as np
+
+import config
+
+try:
+    import av
+except ImportError:
+    av = None
+
+SAMPLE_RATE = 16000
+
+_WAVE_FORMAT_PCM = 1
+_WAVE_FORMAT_IEEE_FLOAT = 3
+_WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+# Sample sizes read here; anything else (ADPCM, mu-law, ...) goes to PyAV or ffmpeg
+_SUPPORTED_BITS = {_WAVE_FORMAT_PCM: (8, 16, 24, 32), _WAVE_FORMAT_IEEE_FLOAT: (32, 64)}
+
+# Long-lived decoder threads shared by all requests
+_executor = ThreadPoolExecutor(max_workers=config.DECODE_WORKERS, thread_name_prefix="audio-decode")
+
+
+class UnsupportedWav(ValueError):
+    pass
+
+
+async def decode(source):
+    # source is a path or a seekable binary file object
+    return await asyncio.get_running_loop().run_in_executor(_executor, load_audio, source)
+
+
+def load_audio(source):
+    if _is_wav(source):
+        try:
+            return _read_wav(source)
+        except UnsupportedWav:
+            pass  # compressed WAV variants (ADPCM, mu-law...) go the general way
+    if av is not None:
+        return _decode_with_av(source)
+    return _decode_with_ffmpeg(source)
+
+
+def _is_wav(source):
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            header = f.read(12)
+    else:
+        source.seek(0)
+        header = source.read(12)
+        source.seek(0)
+    return header[:4] == b"RIFF" and header[8:12] == b"WAVE"
+
+
+def _read_wav(source):
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            return _parse_wav(f)
+    source.seek(0)
+    try:
+        return _parse_wav(source)
+    finally:
+        source.seek(0)
+
+
+def _parse_wav(f):
+    f.read(12)
+    fmt = None
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            raise UnsupportedWav("No data chunk")
+        chunk_id, size = struct.unpack("<4sI", header)
+        if chunk_id == b"fmt ":
+            body = f.read(size + (size & 1))
+            if len(body) < 16:
+                raise UnsupportedWav("Truncated fmt chunk")
+            tag, channels, rate, _, _, bits = struct.unpack("<HHIIHH", body[:16])
+            if tag == _WAVE_FORMAT_EXTENSIBLE and len(body) >= 26:
+                tag = struct.unpack("<H", body[24:26])[0]
+            fmt = (tag, channels, rate, bits)
+        elif chunk_id == b"data":
+            if fmt is None:
+                raise UnsupportedWav("data chunk before fmt chunk")
+            # Recorders that stream WAV often leave the size unset; read to the end then
+            data = f.read() if size in (0, 0xFFFFFFFF) else f.read(size)
+            return _to_mono_16k(data, *fmt)
+        else:
+            f.seek(size + (size & 1), os.SEEK_CUR)
+
+
+def _to_mono_16k(data, tag, channels, rate, bits):
+    # Checked before anything divides by the sample size, channel count or rate
+    if bits not in _SUPPORTED_BITS.get(tag, ()):
+        raise UnsupportedWav(f"Unsupported WAV format {tag} with {bits} bits")
+    if channels < 1 or rate < 1:
+        raise UnsupportedWav(f"Invalid WAV header: {channels} channels at {rate} Hz")
+    width = bits // 8
+    data = data[:len(data) - len(data) % (width * channels)]
+    if tag == _WAVE_FORMAT_PCM and bits == 8:
+        samples = (np.frombuffer(data, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif tag == _WAVE_FORMAT_PCM and bits == 16:
+        samples = np.frombuffer(data, dtype="<i2").astype(np.float32) / 32768
+    elif tag == _WAVE_FORMAT_PCM and bits == 24:
+        raw = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        values = raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)
+        samples = (np.where(values >= 1 << 23, values - (1 << 24), values) / float(1 << 23)).astype(np.float32)
+    elif tag == _WAVE_FORMAT_PCM and bits == 32:
+        samples = (np.frombuffer(data, dtype="<i4") / float(1 << 31)).astype(np.float32)
+    else:
+        samples = np.frombuffer(data, dtype="<f4" if bits == 32 else "<f8").astype(np.float32)
+
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1)
+    return resample(samples, rate)
+
+
+def resample(audio, rate):
+    if rate == SAMPLE_RATE or not len(audio):
+        return np.ascontiguousarray(audio, dtype=np.float32)
+    if rate > SAMPLE_RATE:
+        # Remove what the new rate can't represent before dropping samples, or it folds back as noise
+        audio = _lowpass(audio, 0.5 * SAMPLE_RATE / rate)
+        if rate % SAMPLE_RATE == 0:
+            return np.ascontiguousarray(audio[::rate // SAMPLE_RATE], dtype=np.float32)
+    count = int(round(len(audio) * SAMPLE_RATE / rate))
+    positions = np.arange(count) * (rate / SAMPLE_RATE)
+    resampled = np.interp(positions, np.arange(len(audio)), audio).astype(np.float32)
+    if rate < SAMPLE_RATE:
+        # Interpolating leaves images of the spectrum above the old Nyquist frequency
+        resampled = _lowpass(resampled, 0.5 * rate / SAMPLE_RATE)
+    return resampled
+
+
+def _lowpass(audio, cutoff, taps=127, size=1 << 14):
+    # Windowed-sinc FIR applied with FFT overlap-add; cutoff is a fraction of the input rate
+    n = np.arange(taps) - (taps - 1) / 2
+    kernel = np.sinc(2 * cutoff * 0.9 * n) * np.hanning(taps)
+    kernel /= kernel.sum()
+    block = size - taps + 1
+    spectrum = np.fft.rfft(kernel, size)
+    out = np.zeros(len(audio) + taps - 1, dtype=np.float32)
+    for start in range(0, len(audio), block):
+        piece = audio[start:start + block]
+        filtered = np.fft.irfft(np.fft.rfft(piece, size) * spectrum, size)[:len(piece) + taps - 1]
+        out[start:start + len(filtered)] += filtered
+    delay = (taps - 1) // 2
+    return out[delay:delay + len(audio)]
+
+
+def _decode_with_av(source):
+    if not isinstance(source, str):
+        source.seek(0)
+    resampler = av.AudioResampler(format="flt", layout="mono", rate=SAMPLE_RATE)
+    pieces = []
+    with av.open(source) as container:
+        for frame in container.decode(audio=0):
+            for resampled in resampler.resample(frame):
+                pieces.append(resampled.to_ndarray().reshape(-1))
+        for resampled in resampler.resample(None):
+            pieces.append(resampled.to_ndarray().reshape(-1))
+    if not isinstance(source, str):
+        source.seek(0)
+    return np.concatenate(pieces).astype(np.float32) if pieces else np.zeros(0, dtype=np.float32)
+
+
+def _decode_with_ffmpeg(source):
+    # Imported here: whisper pulls in torch, which only the inference side needs up front
+    import whisper
+
+    if isinstance(source, str):
+        return whisper.load_audio(source)
+    # ffmpeg needs a seekable file for some containers (e.g. m4a with the index at the end)
+    source.seek(0)
+    with tempfile.NamedTemporaryFile() as temp_file:
+        shutil.copyfileobj(source, temp_file)
+        temp_file.flush()
+        source.seek(0)
+        return whisper.load_audio(temp_file.name)
@@ -0,0 +1,83 @@
+# Inference backends: how a named Whisper model is loaded and prepared for this deployment.
+# Every backend returns an object with the openai-whisper model interface (transcribe, dims, device, and
+# whisper.decode support), so the pool, batcher and chunker don't care which one is in use.
+# Pick one with WHISPER_BACKEND; new ones can be added with register().
+# torch and whisper are imported when a model is loaded, not with this module, so the app starts serving quickly.
+
+import threading
+
+import config
+
+_threads_lock = threading.Lock()
+_threads_set = False
+
+
+def configure_threads(threads=config.INFERENCE_THREADS):
+    # torch's intra-op thread count is process-wide, so set it once per process (0 keeps torch's default)
+    import torch
+
+    global _threads_set
+    with _threads_lock:
+        if not _threads_set and threads > 0:
+            torch.set_num_threads(threads)
+        _threads_set = True
+
+
+class TorchBackend:
+    # The stock PyTorch model: fp16 on GPU, fp32 on CPU
+    name = "torch"
+
+    def load(self, model_name):
+        import whisper
+
+        configure_threads()
+        # Looked up at call time so a stub can be swapped in (see bench.py)
+        return whisper.load_model(model_name)
+
+
+class Int8Backend(TorchBackend):
+    # CPU only: the linear layers (the bulk of the encoder and decoder compute) get int8 weights with
+    # activations quantized on the fly. Several times smaller and usually about twice as fast as fp32,
+    # at the cost of a small accuracy drift (measure it with bench.py --drift).
+    name = "int8"
+
+    def load(self, model_name):
+        import torch
+        import whisper
+
+        configure_threads()
+        model = whisper.load_model(model_name, device="cpu")
+        _plain_linears(model)
+        return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+def _plain_linears(module):
+    # whisper.model.Linear only differs from nn.Linear in casting weights to the input dtype, which fp32 on CPU
+    # doesn't need; quantize_dynamic only converts exact nn.Linear modules, so swap them in place first
+    import torch
+
+    for name, child in module.named_children():
+        if isinstance(child, torch.nn.Linear) and type(child) is not torch.nn.Linear:
+            plain = torch.nn.Linear(child.in_features, child.out_features, bias=child.bias is not None)
+            plain.weight = child.weight
+            plain.bias = child.bias
+            setattr(module, name, plain)
+        else:
+            _plain_linears(child)
+
+
+BACKENDS = {
+    TorchBackend.name: TorchBackend,
+    Int8Backend.name: Int8Backend,
+}
+
+
+def register(backend_class):
+    BACKENDS[backend_class.name] = backend_class
+
+
+def get_backend(name=None):
+    name = name or config.BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown inference backend: {name} (available: {', '.join(sorted(BACKENDS))})")
+    return BACKENDS[name]()
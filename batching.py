@@ -0,0 +1,88 @@
+# Micro-batching scheduler: clips submitted close together are decoded in one batched pass.
+# Larger batches and longer waits trade per-request latency for throughput.
+
+import asyncio
+import contextvars
+
+import config
+
+# Clips up to one Whisper window can be batched; longer audio needs the sequential transcribe loop
+WINDOW_SAMPLES = 30 * 16000
+
+
+class MicroBatcher:
+    def __init__(self, run_batch, max_batch=config.BATCH_SIZE, max_wait=config.BATCH_WAIT_MS / 1000):
+        # run_batch(key, items) is a coroutine returning one result per item, in order
+        self._run_batch = run_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = None
+        self._collector = None
+        self._running = set()
+        self.batches = 0
+        self.items = 0
+
+    @property
+    def enabled(self):
+        return self.max_batch > 1
+
+    async def submit(self, key, item):
+        # Items are only batched with others that share the same key (model and decode options)
+        if self._collector is None:
+            self._queue = asyncio.Queue()
+            # Fresh context: batches serve many requests, so none of them should be timed as one caller's
+            self._collector = asyncio.create_task(self._collect(), context=contextvars.Context())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((key, item, future))
+        return await future
+
+    def stop(self):
+        if self._collector is not None:
+            self._collector.cancel()
+            self._collector = None
+
+    def stats(self):
+        return {
+            "max_batch": self.max_batch,
+            "max_wait_ms": round(self.max_wait * 1000),
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+        }
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            groups = {}
+            for key, item, future in batch:
+                groups.setdefault(key, []).append((item, future))
+            for key, entries in groups.items():
+                task = asyncio.create_task(self._run(key, entries))
+                self._running.add(task)
+                task.add_done_callback(self._running.discard)
+
+    async def _run(self, key, entries):
+        self.batches += 1
+        self.items += len(entries)
+        try:
+            results = await self._run_batch(key, [item for item, _ in entries])
+        except Exception as e:
+            for _, future in entries:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        # Results come back in submission order, so each caller gets its own
+        for (_, future), result in zip(entries, results):
+            if not future.done():
+                future.set_result(result)
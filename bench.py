@@ -0,0 +1,353 @@
+# Benchmark for the /transcribe pipeline.
+# Drives the app in-process (or a running server with --url) with synthetic audio and writes JSON results.
+# Run it from the repository root, like the app:
+#
+#   python bench.py --stub --lengths 2,10,60 --requests 20 --concurrency 4 --output bench.json
+#
+# --stub swaps whisper.load_model for a deterministic model that sleeps for --stub-rtf seconds per second of audio,
+# so the upload, queueing, caching and cleanup paths can be measured on CPU-only CI without model weights.
+# The synthetic audio is WAV, which is decoded in-process, so no ffmpeg is needed either.
+#
+#   python bench.py --drift int8 --drift-audio speech1.wav,speech2.mp3 --model base
+#
+# measures what a backend costs in accuracy instead: word error rate against the fp32 model on the same audio,
+# plus the real-time factor of each. Use recordings of real speech; the synthetic noise only exercises the code.
+
+from collections import defaultdict
+from types import SimpleNamespace
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import time
+import wave
+
+import numpy as np
+import torch
+
+SAMPLE_RATE = 16000
+
+
+def synthetic_wav(seconds, seed=0):
+    # Noise bursts with pauses in between, roughly the rhythm of speech, as 16-bit mono WAV bytes
+    rng = np.random.default_rng(seed)
+    samples = int(seconds * SAMPLE_RATE)
+    t = np.arange(samples) / SAMPLE_RATE
+    envelope = (np.sin(2 * np.pi * 0.4 * t + rng.uniform(0, np.pi)) > -0.3).astype(np.float32)
+    audio = 0.2 * rng.standard_normal(samples).astype(np.float32) * envelope
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes((np.clip(audio, -1, 1) * 32767).astype("<i2").tobytes())
+    return buffer.getvalue()
+
+
+def read_wav(path):
+    # The stub model accepts paths too; the synthetic files are already 16 kHz mono PCM
+    with wave.open(path, "rb") as f:
+        frames = f.readframes(f.getnframes())
+    return np.frombuffer(frames, dtype="<i2").astype(np.float32) / 32768.0
+
+
+class StubModel(torch.nn.Module):
+    # Deterministic replacement for a Whisper model: same text for the same audio length, tunable cost.
+    # A weightless module, so every backend can load it (int8 quantization has nothing to convert).
+    def __init__(self, name, rtf):
+        super().__init__()
+        self.name = name
+        self.rtf = rtf
+        self.dims = SimpleNamespace(n_mels=80)
+        self.device = torch.device("cpu")
+
+    def transcribe(self, audio, **options):
+        if isinstance(audio, str):
+            audio = read_wav(audio)
+        duration = len(audio) / SAMPLE_RATE
+        time.sleep(duration * self.rtf)
+        segments = [
+            {
+                "id": i, "seek": start // 30 * 3000, "start": float(start), "end": float(min(start + 5, duration)),
+                "text": f" segment {i}", "temperature": options.get("temperature", (0.0,))[0],
+            }
+            for i, start in enumerate(range(0, max(1, int(np.ceil(duration))), 5))
+        ]
+        return {"text": "".join(s["text"] for s in segments), "segments": segments, "language": "en"}
+
+
+def stub_decode(model, mel, options):
+    # Stand-in for whisper.decode on a batch of 30 second windows
+    time.sleep(30 * model.rtf * len(mel))
+    return [SimpleNamespace(text=f" window {i}", language="en") for i in range(len(mel))]
+
+
+def install_stub(rtf):
+    import whisper
+
+    whisper.load_model = lambda name, **kwargs: StubModel(name, rtf)
+    whisper.decode = stub_decode
+
+
+class StageTimer:
+    # Wraps the pipeline's stage functions and adds up the wall time spent in each
+    def __init__(self):
+        self.totals = defaultdict(float)
+
+    def wrap(self, owner, name, stage):
+        original = getattr(owner, name)
+        if asyncio.iscoroutinefunction(original):
+            async def timed(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await original(*args, **kwargs)
+                finally:
+                    self._add(stage, started)
+        else:
+            def timed(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return original(*args, **kwargs)
+                finally:
+                    self._add(stage, started)
+        setattr(owner, name, timed)
+
+    def reset(self):
+        self.totals.clear()
+
+    def per_request_ms(self, requests):
+        return {stage: round(total * 1000 / requests, 2) for stage, total in sorted(self.totals.items())}
+
+    def _add(self, stage, started):
+        self.totals[stage] += time.perf_counter() - started
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(np.ceil(fraction * len(ordered))) - 1))
+    return ordered[index]
+
+
+def peak_rss_mb(pid=None):
+    if pid is None:
+        # ru_maxrss is in kilobytes on Linux
+        return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return round(int(line.split()[1]) / 1024, 1)
+    return None
+
+
+async def run_length(client, seconds, args, timer):
+    # Unique audio per request unless --repeat-audio, so the transcript cache doesn't hide the decode cost
+    payloads = [synthetic_wav(seconds, seed=0 if args.repeat_audio else i) for i in range(args.requests)]
+    limit = asyncio.Semaphore(args.concurrency)
+    latencies = []
+    errors = defaultdict(int)
+
+    async def one(payload):
+        async with limit:
+            started = time.perf_counter()
+            response = await client.post("/transcribe", files={"file": ("bench.wav", payload, "audio/wav")})
+            if response.status_code == 200:
+                latencies.append(time.perf_counter() - started)
+            else:
+                errors[response.status_code] += 1
+
+    if timer is not None:
+        timer.reset()
+    started = time.perf_counter()
+    await asyncio.gather(*(one(payload) for payload in payloads))
+    elapsed = time.perf_counter() - started
+
+    result = {
+        "audio_seconds": seconds,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "errors": dict(errors),
+        "wall_seconds": round(elapsed, 3),
+        "requests_per_second": round(len(latencies) / elapsed, 2),
+        "latency_ms": None,
+    }
+    if latencies:
+        result["latency_ms"] = {
+            "mean": round(1000 * sum(latencies) / len(latencies), 2),
+            "p50": round(1000 * percentile(latencies, 0.50), 2),
+            "p90": round(1000 * percentile(latencies, 0.90), 2),
+            "p99": round(1000 * percentile(latencies, 0.99), 2),
+            "max": round(1000 * max(latencies), 2),
+        }
+    if timer is not None:
+        result["stages_ms_per_request"] = timer.per_request_ms(args.requests)
+    return result
+
+
+async def run_in_process(args):
+    import httpx
+
+    if args.stub:
+        install_stub(args.stub_rtf)
+
+    import whisper
+    import test
+
+    # Split of server-side time: upload to disk, model loading, decoding (incl. audio load), temp file cleanup
+    timer = StageTimer()
+    timer.wrap(test, "hash_upload", "upload")
+    timer.wrap(test, "save_upload", "upload")
+    timer.wrap(whisper, "load_model", "model_load")
+    timer.wrap(test, "run_inference", "decode")
+    timer.wrap(os, "unlink", "cleanup")
+
+    results = []
+    async with test.app.router.lifespan_context(test.app):
+        transport = httpx.ASGITransport(app=test.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            # Models load and warm up in the background; measure requests against a ready server
+            while (await client.get("/readyz")).status_code == 503 and not test.startup["error"]:
+                await asyncio.sleep(0.05)
+            startup = timer.per_request_ms(1)
+            for seconds in args.lengths:
+                results.append(await run_length(client, seconds, args, timer))
+    return results, startup
+
+
+async def run_against_server(args):
+    import httpx
+
+    async with httpx.AsyncClient(base_url=args.url, timeout=None) as client:
+        return [await run_length(client, seconds, args, None) for seconds in args.lengths], None
+
+
+def word_error_rate(reference, hypothesis):
+    # Word-level edit distance over the reference length, ignoring case and punctuation
+    def words(text):
+        return "".join(c if c.isalnum() or c.isspace() else " " for c in text.lower()).split()
+
+    reference, hypothesis = words(reference), words(hypothesis)
+    if not reference:
+        return 0.0 if not hypothesis else 1.0
+    previous = list(range(len(hypothesis) + 1))
+    for i, ref_word in enumerate(reference, 1):
+        current = [i]
+        for j, hyp_word in enumerate(hypothesis, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ref_word != hyp_word)))
+        previous = current
+    return previous[-1] / len(reference)
+
+
+def measure_drift(args):
+    # Transcribes the same audio with the fp32 torch model and with args.drift, greedily so the only difference is
+    # the backend, and reports word error rate of the backend against fp32 and the real-time factor of each
+    if args.stub:
+        install_stub(args.stub_rtf)
+
+    import audio
+    import backends
+
+    if args.drift_audio:
+        clips = [(path, audio.load_audio(path)) for path in args.drift_audio.split(",")]
+    else:
+        clips = [(f"synthetic {seconds:g}s", read_wav(io.BytesIO(synthetic_wav(seconds)))) for seconds in args.lengths]
+
+    outputs = {}
+    for backend in ("torch", args.drift):
+        model = backends.get_backend(backend).load(args.model)
+        outputs[backend] = []
+        for _, samples in clips:
+            started = time.perf_counter()
+            result = model.transcribe(samples, temperature=0.0, fp16=False)
+            outputs[backend].append((result["text"], time.perf_counter() - started))
+        del model
+
+    files = []
+    pairs = zip(clips, outputs["torch"], outputs[args.drift])
+    for (name, samples), (reference, fp32_seconds), (text, seconds) in pairs:
+        duration = len(samples) / SAMPLE_RATE
+        files.append({
+            "audio": name,
+            "audio_seconds": round(duration, 2),
+            "wer": round(word_error_rate(reference, text), 4),
+            "fp32_rtf": round(fp32_seconds / duration, 4),
+            "backend_rtf": round(seconds / duration, 4),
+            "fp32_text": reference,
+            "backend_text": text,
+        })
+    fp32_total = sum(seconds for _, seconds in outputs["torch"])
+    backend_total = sum(seconds for _, seconds in outputs[args.drift])
+    return {
+        "backend": args.drift,
+        "model": args.model,
+        "mean_wer": round(sum(f["wer"] for f in files) / len(files), 4),
+        "speedup": round(fp32_total / backend_total, 2) if backend_total else None,
+        "files": files,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the /transcribe pipeline")
+    parser.add_argument("--lengths", default="2,10,30", help="comma separated audio lengths in seconds")
+    parser.add_argument("--requests", type=int, default=10, help="requests per audio length")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--stub", action="store_true", help="use a deterministic stub instead of Whisper")
+    parser.add_argument("--stub-rtf", type=float, default=0.01, help="stub decode seconds per audio second")
+    parser.add_argument("--repeat-audio", action="store_true", help="send identical audio to measure cache hits")
+    parser.add_argument("--url", help="benchmark a running server instead of the in-process app")
+    parser.add_argument("--server-pid", type=int, help="with --url, report this process's peak RSS")
+    parser.add_argument("--drift", metavar="BACKEND", help="instead of load testing, compare BACKEND against fp32")
+    parser.add_argument("--drift-audio", help="comma separated audio files for --drift (default: synthetic --lengths)")
+    parser.add_argument("--model", default=os.environ.get("WHISPER_MODEL", "base"), help="model for --drift")
+    parser.add_argument("--output", help="write JSON results here (default: stdout)")
+    args = parser.parse_args()
+    args.lengths = [float(length) for length in args.lengths.split(",")]
+
+    drift = None
+    if args.drift:
+        results, startup = None, None
+        drift = measure_drift(args)
+        rss = peak_rss_mb()
+    elif args.url:
+        results, startup = asyncio.run(run_against_server(args))
+        rss = peak_rss_mb(args.server_pid) if args.server_pid else None
+    else:
+        results, startup = asyncio.run(run_in_process(args))
+        rss = peak_rss_mb()
+
+    report = {
+        "timestamp": time.time(),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "mode": "drift" if args.drift else "url" if args.url else "in-process",
+        "stub": args.stub,
+        "stub_rtf": args.stub_rtf if args.stub else None,
+        "env": {name: value for name, value in os.environ.items() if name.startswith("WHISPER_")},
+        "startup_ms": startup,
+        "peak_rss_mb": rss,
+        "results": results,
+        "drift": drift,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+# Content-addressed transcript cache.
+# Keys combine the audio hash with the model and decode options, so the same recording decoded
+# differently gets its own entry. A small in-memory LRU sits in front of an optional disk tier.
+
+from collections import OrderedDict
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+import config
+
+
+def cache_key(audio_digest, model_name, options=None):
+    options_json = json.dumps(options or {}, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(f"{audio_digest}:{model_name}:{options_json}".encode()).hexdigest()
+
+
+class MemoryTier:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        count = len(self._entries)
+        self._entries.clear()
+        return count
+
+    def stats(self):
+        return {"entries": len(self._entries), "max_entries": self.max_entries}
+
+
+class DiskTier:
+    # One JSON file per entry; the least recently read files go first once the directory is over budget.
+    # Several processes may share the directory, so the size is measured on disk now and then rather than only
+    # counted from this process's own writes.
+    RESCAN_EVERY = 32  # writes
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._bytes = self._measure()
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                value = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        os.utime(path)
+        return value
+
+    def put(self, key, value):
+        path = self._path(key)
+        # Write to a temporary name first so readers never see a partial file
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(value, f)
+        old_size = os.path.getsize(path) if os.path.exists(path) else 0
+        os.replace(temp_path, path)
+        with self._lock:
+            self._bytes += os.path.getsize(path) - old_size
+            self._writes += 1
+            if self._writes % self.RESCAN_EVERY == 0:
+                self._bytes = self._measure()
+            if self._bytes > self.max_bytes:
+                self._evict()
+
+    def clear(self):
+        count = 0
+        with self._lock:
+            for entry in self._files():
+                try:
+                    os.unlink(entry.path)
+                except FileNotFoundError:
+                    continue
+                count += 1
+            self._bytes = self._measure()
+        return count
+
+    def stats(self):
+        return {"directory": self.directory, "bytes": self._bytes, "max_bytes": self.max_bytes}
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _files(self):
+        return [entry for entry in os.scandir(self.directory) if entry.name.endswith(".json")]
+
+    def _stats(self):
+        # (entry, stat) for the files still there; another process may remove one at any time
+        stats = []
+        for entry in self._files():
+            try:
+                stats.append((entry, entry.stat()))
+            except FileNotFoundError:
+                pass
+        return stats
+
+    def _measure(self):
+        return sum(stat.st_size for _, stat in self._stats())
+
+    def _evict(self):
+        # From what is on disk, including other processes' entries
+        entries = sorted(self._stats(), key=lambda item: item[1].st_mtime)
+        self._bytes = sum(stat.st_size for _, stat in entries)
+        for entry, stat in entries:
+            if self._bytes <= self.max_bytes:
+                break
+            try:
+                os.unlink(entry.path)
+            except FileNotFoundError:
+                pass
+            self._bytes -= stat.st_size
+
+
+class TranscriptCache:
+    def __init__(self, max_entries=config.CACHE_ENTRIES, directory=config.CACHE_DIR, disk_mb=config.CACHE_DISK_MB):
+        self.memory = MemoryTier(max_entries)
+        self.disk = DiskTier(directory, disk_mb * 1024 * 1024) if directory else None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        # The disk tier is read outside the lock, so a slow read doesn't hold up memory hits
+        with self._lock:
+            value = self.memory.get(key)
+        from_disk = value is None and self.disk is not None
+        if from_disk:
+            value = self.disk.get(key)
+        with self._lock:
+            if value is not None and from_disk:
+                # Promote so the next hit is served from memory
+                self.memory.put(key, value)
+                self.disk_hits += 1
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def put(self, key, value):
+        with self._lock:
+            self.memory.put(key, value)
+        if self.disk is not None:
+            self.disk.put(key, value)
+
+    async def get_async(self, key):
+        # For the event loop: with a disk tier, file reads happen in a thread
+        if self.disk is None:
+            return self.get(key)
+        return await asyncio.to_thread(self.get, key)
+
+    async def put_async(self, key, value):
+        if self.disk is None:
+            return self.put(key, value)
+        return await asyncio.to_thread(self.put, key, value)
+
+    def purge(self):
+        with self._lock:
+            removed = {"memory": self.memory.clear()}
+        if self.disk is not None:
+            removed["disk"] = self.disk.clear()
+        return removed
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "memory": self.memory.stats(),
+                "disk": self.disk.stats() if self.disk is not None else None,
+            }
+
+
+cache = TranscriptCache()
@@ -0,0 +1,123 @@
+# Long-file mode: find speech with a cheap energy detector, cut the audio at silences,
+# transcribe the pieces in parallel and stitch the segments back onto one timeline.
+
+import asyncio
+
+import numpy as np
+
+import config
+import formats
+from audio import SAMPLE_RATE
+
+FRAME_SAMPLES = 480  # 30 ms
+MIN_GAP_FRAMES = 10  # pauses shorter than 300 ms are part of the speech around them
+PAD_SAMPLES = 3200  # keep 200 ms around each region so word edges aren't clipped
+
+
+def speech_regions(audio, threshold_db=config.VAD_THRESHOLD_DB):
+    # Returns (start, end) sample ranges that contain sound
+    count = len(audio) // FRAME_SAMPLES
+    if count == 0:
+        return [(0, len(audio))] if len(audio) else []
+    frames = audio[:count * FRAME_SAMPLES].reshape(count, FRAME_SAMPLES)
+    energy_db = 10 * np.log10(np.mean(frames ** 2, axis=1) + 1e-10)
+
+    # Relative to the loud parts of this file, so recording level doesn't matter; never below -60 dB absolute
+    voiced = energy_db > max(np.percentile(energy_db, 95) + threshold_db, -60)
+
+    regions = []
+    start = None
+    silent_run = 0
+    for index, is_voiced in enumerate(voiced):
+        if is_voiced:
+            if start is None:
+                start = index
+            silent_run = 0
+        elif start is not None:
+            silent_run += 1
+            if silent_run >= MIN_GAP_FRAMES:
+                regions.append((start, index - silent_run + 1))
+                start = None
+    if start is not None:
+        regions.append((start, count))
+
+    return [
+        (max(0, begin * FRAME_SAMPLES - PAD_SAMPLES), min(len(audio), end * FRAME_SAMPLES + PAD_SAMPLES))
+        for begin, end in regions
+    ]
+
+
+def plan_chunks(regions, max_seconds=config.CHUNK_SECONDS, skip_silence=config.SKIP_SILENCE_SECONDS):
+    # Merge neighbouring regions into pieces of at most max_seconds; long silences always end a piece
+    # and are left out. A single region longer than max_seconds has no silence to cut at, so it is
+    # split evenly.
+    max_samples = int(max_seconds * SAMPLE_RATE)
+    skip_samples = int(skip_silence * SAMPLE_RATE)
+    chunks = []
+    for start, end in regions:
+        if chunks:
+            last_start, last_end = chunks[-1]
+            if start - last_end < skip_samples and end - last_start <= max_samples:
+                chunks[-1] = (last_start, max(last_end, end))
+                continue
+        while end - start > max_samples:
+            chunks.append((start, start + max_samples))
+            start += max_samples
+        chunks.append((start, end))
+    return chunks
+
+
+async def transcribe_chunked(audio, decode, workers, progress=None, max_seconds=config.CHUNK_SECONDS):
+    # decode is a coroutine function taking a 16 kHz float32 array and returning a result (see formats.py).
+    # At most `workers` pieces are in flight so one file doesn't fill the whole queue.
+    duration = len(audio) / SAMPLE_RATE
+    chunks = plan_chunks(speech_regions(audio), max_seconds=max_seconds)
+    if not chunks:
+        return formats.merge([], duration)
+
+    limit = asyncio.Semaphore(workers)
+    done = 0
+
+    async def run(start, end):
+        nonlocal done
+        async with limit:
+            result = await decode(audio[start:end])
+        done += 1
+        if progress is not None:
+            progress(done / len(chunks))
+        return formats.shift(result, start / SAMPLE_RATE)
+
+    tasks = [asyncio.ensure_future(run(start, end)) for start, end in chunks]
+    try:
+        pieces = await asyncio.gather(*tasks)
+    except BaseException:
+        # One failed piece fails the file; don't leave the others queued
+        for task in tasks:
+            task.cancel()
+        raise
+    return formats.merge(pieces, duration)
+
+
+async def stream_windows(audio, decode, prompt_chars=200, max_seconds=30):
+    # Sequential variant: pieces of at most max_seconds are decoded in order, each conditioned on the text before it
+    # like whisper's own windows, and yielded with the fraction of the file covered so far.
+    # decode takes (samples, prompt, language) and returns a result. language is None until a piece with speech has
+    # been decoded, then that piece's language, so the rest of the file skips language detection.
+    prompt = None
+    language = None
+    for start, end in plan_chunks(speech_regions(audio), max_seconds=max_seconds):
+        result = await decode(audio[start:end], prompt, language)
+        if result["text"]:
+            prompt = ((prompt or "") + result["text"])[-prompt_chars:]
+            language = language or result.get("language")
+        yield formats.shift(result, start / SAMPLE_RATE), end / len(audio)
+
+
+async def transcribe_sequential(audio, decode, progress=None, max_seconds=30):
+    # stream_windows collected into one result, for callers that want the whole file
+    pieces = []
+    async for piece, covered in stream_windows(audio, decode, max_seconds=max_seconds):
+        pieces.append(piece)
+        if progress is not None:
+            progress(covered)
+    return formats.merge(pieces, len(audio) / SAMPLE_RATE)
@@ -0,0 +1,107 @@
+# Deployment settings for the transcription service.
+# Everything is read from the environment so it can be set on the uvicorn command line, e.g.
+#   WHISPER_PRELOAD=base,small WHISPER_MODEL_MEMORY_MB=4096 uvicorn test:app
+
+import os
+
+
+def _int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def _list(name, default):
+    return [item.strip() for item in os.environ.get(name, default).split(",") if item.strip()]
+
+
+# Model used when the request does not ask for a specific one
+DEFAULT_MODEL = os.environ.get("WHISPER_MODEL", "base")
+
+# Models loaded at startup instead of on first use
+PRELOAD_MODELS = _list("WHISPER_PRELOAD", DEFAULT_MODEL)
+
+# Memory budget for resident models; least recently used models are evicted above it
+MODEL_MEMORY_MB = _int("WHISPER_MODEL_MEMORY_MB", 4096)
+
+# Inference backend: "torch" (stock fp32/fp16 model) or "int8" (CPU, dynamically quantized linear layers),
+# and torch's intra-op thread count per process (0 keeps torch's default of one per core)
+BACKEND = os.environ.get("WHISPER_BACKEND", "torch")
+INFERENCE_THREADS = _int("WHISPER_THREADS", 0)
+
+# Inference pool: "thread" shares the resident models, "process" gives each worker its own copy, "queue" hands the
+# work to the separate inference_worker.py processes (multi-process mode). With "queue", WHISPER_WORKERS is how
+# many tasks each front-end has in the queue at once.
+POOL_KIND = os.environ.get("WHISPER_POOL", "thread")
+POOL_WORKERS = _int("WHISPER_WORKERS", 1)
+
+# Multi-process mode: the SQLite file front-ends and inference workers share, and how often both check it
+QUEUE_DB_PATH = os.environ.get("WHISPER_QUEUE_DB", "queue.db")
+QUEUE_POLL_MS = _int("WHISPER_QUEUE_POLL_MS", 20)
+
+# Scheduling: requests are "interactive" (live recording, or audio up to WHISPER_INTERACTIVE_SECONDS), "bulk"
+# (background jobs, or audio over WHISPER_BULK_SECONDS) or "normal", unless an X-Priority header says otherwise.
+# Audio longer than WHISPER_PREEMPT_SECONDS (up to WHISPER_LONG_FILE_SECONDS) is decoded in order in pieces of at most
+# that length, so it gives its worker back between pieces and waiting interactive requests go first (0 decodes such
+# files in one go). Long files are already decoded in pieces of WHISPER_CHUNK_SECONDS.
+INTERACTIVE_SECONDS = float(os.environ.get("WHISPER_INTERACTIVE_SECONDS", 30))
+BULK_SECONDS = float(os.environ.get("WHISPER_BULK_SECONDS", 600))
+PREEMPT_SECONDS = float(os.environ.get("WHISPER_PREEMPT_SECONDS", 30))
+
+# Requests allowed to wait for a free worker before new ones are turned away with 503
+QUEUE_SIZE = _int("WHISPER_QUEUE_SIZE", 8)
+# Places in that queue only interactive requests may take, so a backlog of other work can't turn voice notes away
+INTERACTIVE_RESERVE = _int("WHISPER_INTERACTIVE_RESERVE", 2)
+
+# Where background jobs are kept: "memory" (lost on restart) or "sqlite" (results survive restarts)
+JOB_STORE = os.environ.get("WHISPER_JOB_STORE", "memory")
+JOB_DB_PATH = os.environ.get("WHISPER_JOB_DB", "jobs.db")
+# The memory store keeps this many finished jobs (and their transcripts); older ones are forgotten
+MAX_FINISHED_JOBS = _int("WHISPER_MAX_FINISHED_JOBS", 100)
+
+# Uploads larger than this are rejected with 413 before they are read (0 disables the limit)
+MAX_UPLOAD_MB = _int("WHISPER_MAX_UPLOAD_MB", 500)
+
+# Uploads are copied to disk in chunks of this size, so memory per request stays flat
+UPLOAD_CHUNK_BYTES = _int("WHISPER_UPLOAD_CHUNK_BYTES", 1024 * 1024)
+
+# Transcript cache: in-memory entries, plus an optional on-disk tier when WHISPER_CACHE_DIR is set
+CACHE_ENTRIES = _int("WHISPER_CACHE_ENTRIES", 256)
+CACHE_DIR = os.environ.get("WHISPER_CACHE_DIR", "")
+CACHE_DISK_MB = _int("WHISPER_CACHE_DISK_MB", 1024)
+
+# When set, admin endpoints require this value in the X-Admin-Token header
+ADMIN_TOKEN = os.environ.get("WHISPER_ADMIN_TOKEN", "")
+
+# Live transcription over WebSocket: re-decode after this much new audio, never buffer more than the window,
+# and only finalize segments that end at least the holdback before the newest audio
+STREAM_STEP_SECONDS = float(os.environ.get("WHISPER_STREAM_STEP_SECONDS", 1.0))
+STREAM_WINDOW_SECONDS = float(os.environ.get("WHISPER_STREAM_WINDOW_SECONDS", 30.0))
+STREAM_HOLDBACK_SECONDS = float(os.environ.get("WHISPER_STREAM_HOLDBACK_SECONDS", 2.0))
+
+# Micro-batching of short clips (up to one 30 second window): up to WHISPER_BATCH_SIZE clips that arrive within
+# WHISPER_BATCH_WAIT_MS of each other share one encoder/decoder pass. A batch size of 1 turns batching off.
+BATCH_SIZE = _int("WHISPER_BATCH_SIZE", 8)
+BATCH_WAIT_MS = _int("WHISPER_BATCH_WAIT_MS", 20)
+
+# Long-file mode: audio longer than WHISPER_LONG_FILE_SECONDS is split at silences into pieces of at most
+# WHISPER_CHUNK_SECONDS that are transcribed in parallel. Silences of WHISPER_SKIP_SILENCE_SECONDS or more are
+# not transcribed at all; WHISPER_VAD_THRESHOLD_DB is how far below the loud parts a frame counts as silent.
+LONG_FILE_SECONDS = float(os.environ.get("WHISPER_LONG_FILE_SECONDS", 120))
+CHUNK_SECONDS = float(os.environ.get("WHISPER_CHUNK_SECONDS", 90))
+SKIP_SILENCE_SECONDS = float(os.environ.get("WHISPER_SKIP_SILENCE_SECONDS", 2.0))
+VAD_THRESHOLD_DB = float(os.environ.get("WHISPER_VAD_THRESHOLD_DB", -35))
+
+# Per-request stage timings (Server-Timing header) and Prometheus metrics at /metrics; 0 turns both off
+METRICS_ENABLED = os.environ.get("WHISPER_METRICS", "1") != "0"
+
+# Threads decoding uploaded audio to 16 kHz samples (WAV in-process, other formats via PyAV when installed)
+DECODE_WORKERS = _int("WHISPER_DECODE_WORKERS", 2)
+
+# Per-client default decode options (language, task, beam size, temperature schedule, conditioning): a JSON file
+# mapping X-Client-Id values, or "default" for everyone else, to options; request parameters override them
+PROFILES_PATH = os.environ.get("WHISPER_PROFILES", "")
+
+# Archive of every transcript with full-text search (GET /transcripts, /transcripts/search); empty turns it off
+TRANSCRIPT_DB_PATH = os.environ.get("WHISPER_TRANSCRIPT_DB", "transcripts.db")
+
+# Word-level timings in results (extra alignment pass per segment); clips decoded in a batch only get segment timings
+WORD_TIMESTAMPS = os.environ.get("WHISPER_WORD_TIMESTAMPS", "1") != "0"
@@ -0,0 +1,100 @@
+# Decode options a request can set, and per-client default profiles.
+# Options are normalized to a small JSON-serializable dict: it is passed to model.transcribe as keyword arguments
+# and becomes part of the transcript cache key, so requests that decode the same way share cache entries.
+# Precedence: whisper's defaults < the client's profile (or the "default" one) < the request's own parameters.
+
+import json
+
+import config
+
+TASKS = ("transcribe", "translate")
+
+# What whisper does when nothing is set: detect the language per file, greedy decoding, and on a failed
+# compression-ratio or log-probability check re-decode the window at each higher temperature in turn
+DEFAULTS = {
+    "language": None,
+    "task": "transcribe",
+    "beam_size": None,
+    "temperature": (0.0, 0.2, 0.4, 0.6, 0.8, 1.0),
+    "condition_on_previous_text": True,
+}
+
+
+def normalize(options):
+    # Validates a partial set of options (request parameters or a profile), all values given as strings or JSON
+    # values; raises ValueError with a message fit for the client
+    normalized = {}
+    for name, value in options.items():
+        if name not in DEFAULTS:
+            raise ValueError(f"Unknown decode option {name!r}")
+        if value is None or value == "":
+            normalized[name] = DEFAULTS[name]
+        elif name == "language":
+            normalized[name] = _language(value)
+        elif name == "task":
+            if value not in TASKS:
+                raise ValueError(f"task must be one of {', '.join(TASKS)}")
+            normalized[name] = value
+        elif name == "beam_size":
+            beam_size = _number(name, value, int)
+            if beam_size < 0:
+                raise ValueError("beam_size must be 0 (greedy) or more")
+            normalized[name] = beam_size or None
+        elif name == "temperature":
+            values = value.split(",") if isinstance(value, str) else value if isinstance(value, list) else [value]
+            schedule = tuple(_number(name, item, float) for item in values)
+            if not schedule or any(not 0 <= t <= 1 for t in schedule) or list(schedule) != sorted(schedule):
+                raise ValueError("temperature must be one value or a rising list of values between 0 and 1")
+            normalized[name] = schedule
+        elif name == "condition_on_previous_text":
+            normalized[name] = _flag(name, value)
+    return normalized
+
+
+def load_profiles(path=config.PROFILES_PATH):
+    # {"default": {...}, "<client id>": {...}}; checked at startup so a typo fails loudly rather than per request
+    if not path:
+        return {}
+    with open(path) as f:
+        profiles = json.load(f)
+    return {name: normalize(options) for name, options in profiles.items()}
+
+
+def resolve(client_id, params):
+    # Full options for a request from the client's profile and the request parameters that name an option
+    profile = profiles.get(client_id) or profiles.get("default", {})
+    return {**DEFAULTS, **profile, **normalize({name: params[name] for name in DEFAULTS if name in params})}
+
+
+def _language(value):
+    # Imported here: whisper pulls in torch, and only requests that name a language need the table
+    from whisper.tokenizer import LANGUAGES, TO_LANGUAGE_CODE
+
+    value = value.lower()
+    if value == "auto":
+        return None
+    if value in LANGUAGES:
+        return value
+    if value in TO_LANGUAGE_CODE:
+        return TO_LANGUAGE_CODE[value]
+    raise ValueError(f"Unsupported language {value!r}")
+
+
+def _number(name, value, kind):
+    try:
+        return kind(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be a number") from None
+
+
+def _flag(name, value):
+    if isinstance(value, bool):
+        return value
+    if str(value).lower() in ("1", "true", "yes"):
+        return True
+    if str(value).lower() in ("0", "false", "no"):
+        return False
+    raise ValueError(f"{name} must be true or false")
+
+
+profiles = load_profiles()
@@ -0,0 +1,127 @@
+# Transcription results and the formats they can be rendered in.
+# A result is a plain JSON-serializable dict, so it can be cached and stored as is:
+#   {"text": ..., "language": ..., "duration": ..., "segments": [{"start", "end", "text", "words"?}, ...],
+#    "decode": {"windows": ..., "fallbacks": ..., "batched"?: true}}
+# Every output format is rendered from it, so switching format never needs another decode.
+
+import json
+
+MEDIA_TYPES = {
+    "text": "text/plain; charset=utf-8",
+    "json": "application/json",
+    "srt": "application/x-subrip",
+    "vtt": "text/vtt; charset=utf-8",
+}
+
+_ACCEPT_FORMATS = {
+    "application/json": "json",
+    "application/x-subrip": "srt",
+    "text/srt": "srt",
+    "text/vtt": "vtt",
+    "text/plain": "text",
+}
+
+
+def from_whisper(result, duration=None):
+    segments = []
+    for segment in result["segments"]:
+        entry = {"start": round(segment["start"], 3), "end": round(segment["end"], 3), "text": segment["text"]}
+        if segment.get("words"):
+            entry["words"] = [
+                {
+                    "word": word["word"],
+                    "start": round(float(word["start"]), 3),
+                    "end": round(float(word["end"]), 3),
+                    "probability": round(float(word["probability"]), 3),
+                }
+                for word in segment["words"]
+            ]
+        segments.append(entry)
+    return {"text": result["text"], "language": result.get("language"), "duration": duration, "segments": segments}
+
+
+def single_segment(text, language, duration):
+    # For decodes that don't produce timestamps (batched clips): one segment spanning the clip
+    segments = [{"start": 0.0, "end": round(duration, 3), "text": text}] if text.strip() else []
+    return {"text": text, "language": language, "duration": duration, "segments": segments}
+
+
+def shift(result, offset):
+    # Move a piece's timestamps onto the timeline of the whole file
+    def moved(item):
+        return {**item, "start": round(item["start"] + offset, 3), "end": round(item["end"] + offset, 3)}
+
+    segments = []
+    for segment in result["segments"]:
+        segment = moved(segment)
+        if "words" in segment:
+            segment["words"] = [moved(word) for word in segment["words"]]
+        segments.append(segment)
+    return {**result, "segments": segments}
+
+
+def merge(results, duration=None):
+    # Results of consecutive pieces, already shifted, joined into one
+    languages = [result["language"] for result in results if result.get("language")]
+    stats = [result["decode"] for result in results if "decode" in result]
+    merged = {
+        "text": "".join(result["text"] for result in results),
+        "language": languages[0] if languages else None,
+        "duration": duration,
+        "segments": [segment for result in results for segment in result["segments"]],
+    }
+    if stats:
+        merged["decode"] = {name: sum(stat[name] for stat in stats) for name in ("windows", "fallbacks")}
+    return merged
+
+
+def negotiate(requested, accept=""):
+    # An explicit ?format= wins over the Accept header; None means the caller didn't ask for anything
+    if requested:
+        if requested not in MEDIA_TYPES:
+            raise ValueError(f"Unknown format {requested!r}, expected one of {', '.join(MEDIA_TYPES)}")
+        return requested
+    for part in accept.split(","):
+        fmt = _ACCEPT_FORMATS.get(part.split(";")[0].strip())
+        if fmt is not None:
+            return fmt
+    return None
+
+
+def render(result, fmt):
+    if isinstance(result, str):
+        # Results stored before structured output existed are plain text
+        result = {"text": result, "language": None, "duration": None, "segments": []}
+    if fmt == "json":
+        return json.dumps(result), MEDIA_TYPES[fmt]
+    if fmt == "srt":
+        return _subtitles(result, _srt_time, numbered=True), MEDIA_TYPES[fmt]
+    if fmt == "vtt":
+        return "WEBVTT\n\n" + _subtitles(result, _vtt_time, numbered=False), MEDIA_TYPES[fmt]
+    return result["text"], MEDIA_TYPES["text"]
+
+
+def _subtitles(result, timestamp, numbered):
+    cues = []
+    for index, segment in enumerate(result["segments"], start=1):
+        lines = [str(index)] if numbered else []
+        lines.append(f"{timestamp(segment['start'])} --> {timestamp(segment['end'])}")
+        lines.append(segment["text"].strip())
+        cues.append("\n".join(lines))
+    return "\n\n".join(cues) + "\n" if cues else ""
+
+
+def _split_time(seconds):
+    milliseconds = int(round(seconds * 1000))
+    hours, milliseconds = divmod(milliseconds, 3600000)
+    minutes, milliseconds = divmod(milliseconds, 60000)
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    return hours, minutes, seconds, milliseconds
+
+
+def _srt_time(seconds):
+    return "{:02d}:{:02d}:{:02d},{:03d}".format(*_split_time(seconds))
+
+
+def _vtt_time(seconds):
+    return "{:02d}:{:02d}:{:02d}.{:03d}".format(*_split_time(seconds))
@@ -0,0 +1,81 @@
+# Work that runs inside the inference pool.
+# These are plain module-level functions so they can also be shipped to a process pool.
+
+import numpy as np
+
+import config
+import decoding
+import formats
+from audio import SAMPLE_RATE
+from models import registry
+
+
+def transcribe_audio(model_name, audio, prompt=None, options=None):
+    # audio is a 16 kHz float32 array; prompt is the text preceding it, if any; options come from decoding.resolve
+    options = options or decoding.DEFAULTS
+    if not options["condition_on_previous_text"]:
+        prompt = None
+    with registry.using(model_name) as model:
+        result = model.transcribe(audio, initial_prompt=prompt, word_timestamps=config.WORD_TIMESTAMPS, **options)
+    return {
+        **formats.from_whisper(result, len(audio) / SAMPLE_RATE),
+        "decode": _decode_stats(result["segments"], options["temperature"]),
+    }
+
+
+def transcribe_segments(model_name, audio, options=None):
+    # Lighter variant for the live view: segment timings and text only
+    options = options or decoding.DEFAULTS
+    with registry.using(model_name) as model:
+        result = model.transcribe(audio, **options)
+    return {
+        "language": result.get("language"),
+        "segments": [
+            {"start": segment["start"], "end": segment["end"], "text": segment["text"]}
+            for segment in result["segments"]
+        ],
+        "decode": _decode_stats(result["segments"], options["temperature"]),
+    }
+
+
+def decode_batch(model_name, audios, options=None):
+    # Clips of at most one 30 second window each, decoded greedily in a single batched encoder/decoder pass.
+    # There is no temperature fallback here: the batch is decoded once, at the first temperature of the schedule.
+    import torch
+    import whisper
+
+    options = options or decoding.DEFAULTS
+    with registry.using(model_name) as model:
+        mels = torch.stack([
+            whisper.log_mel_spectrogram(whisper.pad_or_trim(torch.from_numpy(audio)), model.dims.n_mels)
+            for audio in audios
+        ]).to(model.device)
+        decode_options = whisper.DecodingOptions(
+            task=options["task"],
+            language=options["language"],
+            temperature=options["temperature"][0],
+            fp16=model.device.type == "cuda",
+        )
+        results = whisper.decode(model, mels, decode_options)
+    return [
+        {
+            **formats.single_segment(result.text, result.language, len(audio) / SAMPLE_RATE),
+            "decode": {"windows": 1, "fallbacks": 0, "batched": True},
+        }
+        for result, audio in zip(results, audios)
+    ]
+
+
+def _decode_stats(segments, temperatures):
+    # Each 30 second window records the temperature it was finally decoded at; every step up the schedule
+    # was one more full decode of that window after a failed compression-ratio or log-probability check
+    windows = {segment["seek"]: segment["temperature"] for segment in segments}
+    return {"windows": len(windows), "fallbacks": sum(temperatures.index(t) for t in windows.values())}
+
+
+def warm_up_models(model_names):
+    # Load each model and decode a second of silence, so the first real request doesn't pay for loading weights,
+    # importing torch or any lazy kernel setup
+    silence = np.zeros(SAMPLE_RATE, dtype=np.float32)
+    for name in model_names:
+        transcribe_audio(name, silence)
@@ -0,0 +1,111 @@
+# Inference workers for multi-process mode (WHISPER_POOL=queue).
+# The models are loaded and warmed up once in this process, which then forks the workers: they share the weights
+# copy-on-write, so each extra worker costs its activations and little else. Workers take tasks from the SQLite
+# queue the web front-ends write to (see taskqueue.py). Dead workers are reported to their callers and replaced.
+#
+#   python inference_worker.py --workers 4
+#
+# Fork after load needs the models on CPU: a CUDA context doesn't survive fork.
+
+import argparse
+import gc
+import multiprocessing
+import os
+import pickle
+import signal
+import threading
+import time
+
+import config
+from inference import warm_up_models
+from taskqueue import TaskQueue
+
+HEARTBEAT_SECONDS = 2
+# Finished results nobody collected (their front-end went away) are dropped after this long
+PURGE_AFTER_SECONDS = 3600
+
+
+def run_worker(worker_id, poll_interval):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C reaches the whole group; let the supervisor stop us
+    queue = TaskQueue()
+    started_at = time.time()
+
+    def heartbeat():
+        # From a thread, so a worker busy with a long file still counts as alive
+        beats = TaskQueue()
+        while True:
+            beats.heartbeat(worker_id, os.getpid(), started_at)
+            time.sleep(HEARTBEAT_SECONDS)
+
+    threading.Thread(target=heartbeat, daemon=True).start()
+    while True:
+        task = queue.claim(worker_id)
+        if task is None:
+            time.sleep(poll_interval)
+            continue
+        task_id, payload = task
+        try:
+            fn, args, kwargs = pickle.loads(payload)
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            try:
+                exception = pickle.dumps(e)
+            except Exception:
+                exception = None
+            queue.fail(task_id, exception, f"{type(e).__name__}: {e}")
+        else:
+            queue.finish(task_id, pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run Whisper inference workers for WHISPER_POOL=queue front-ends")
+    parser.add_argument("--workers", type=int, default=config.POOL_WORKERS, help="worker processes to fork")
+    parser.add_argument("--models", default=",".join(config.PRELOAD_MODELS), help="comma separated models to load")
+    args = parser.parse_args()
+
+    models = [name for name in args.models.split(",") if name]
+    print(f"Loading {', '.join(models) or 'no models'}", flush=True)
+    warm_up_models(models)
+    # Objects that exist now live for the whole process; keeping the collector off them stops it from writing to
+    # (and so copying) the pages the workers share
+    gc.freeze()
+
+    context = multiprocessing.get_context("fork")
+    poll_interval = config.QUEUE_POLL_MS / 1000
+    children = {}
+
+    def start(worker_id):
+        process = context.Process(target=run_worker, args=(worker_id, poll_interval), name=worker_id)
+        process.start()
+        children[worker_id] = process
+
+    for index in range(args.workers):
+        start(f"{os.uname().nodename}-{os.getpid()}-{index}")
+    print(f"Started {args.workers} workers on {config.QUEUE_DB_PATH}", flush=True)
+
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+    signal.signal(signal.SIGINT, lambda *_: stopping.set())
+
+    # The supervisor's own connection is opened after the fork, so no child inherits it
+    queue = TaskQueue()
+    last_purge = 0.0
+    while not stopping.wait(1):
+        for worker_id, process in list(children.items()):
+            if not process.is_alive():
+                print(f"Worker {worker_id} exited with {process.exitcode}; restarting", flush=True)
+                queue.fail_worker(worker_id, f"Inference worker exited with code {process.exitcode}")
+                start(worker_id)
+        if time.time() - last_purge > 60:
+            queue.purge(PURGE_AFTER_SECONDS)
+            last_purge = time.time()
+
+    for process in children.values():
+        process.terminate()
+    for worker_id, process in children.items():
+        process.join()
+        queue.fail_worker(worker_id, "Inference worker stopped")
+
+
+if __name__ == "__main__":
+    main()
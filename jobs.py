@@ -0,0 +1,200 @@
+# Storage for background transcription jobs.
+# Jobs move queued -> running -> done/failed; the store only records state, the app drives it.
+
+from collections import OrderedDict
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+import config
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+_FIELDS = ("id", "status", "progress", "filename", "error", "created_at", "updated_at")
+
+
+def _boot_id():
+    try:
+        with open("/proc/sys/kernel/random/boot_id") as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+
+BOOT_ID = _boot_id()
+
+
+def _owner():
+    # The process running a job; with the boot id, a pid from before a reboot can't be mistaken for a live one
+    return f"{BOOT_ID}:{os.getpid()}"
+
+
+def _owner_alive(owner):
+    boot_id, _, pid = (owner or "").rpartition(":")
+    if boot_id != BOOT_ID or not pid.isdigit():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _new_job(filename):
+    now = time.time()
+    return {
+        "id": uuid.uuid4().hex,
+        "status": QUEUED,
+        "progress": 0.0,
+        "filename": filename,
+        "error": None,
+        "created_at": now,
+        "updated_at": now,
+    }
+
+
+class MemoryJobStore:
+    def __init__(self, max_finished=config.MAX_FINISHED_JOBS):
+        self.max_finished = max_finished
+        self._jobs = {}
+        self._results = {}
+        self._finished = OrderedDict()  # ids of done and failed jobs, oldest first
+        self._lock = threading.Lock()
+
+    def create(self, filename):
+        job = _new_job(filename)
+        with self._lock:
+            self._jobs[job["id"]] = job
+        return dict(job)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs[job_id]
+            job.update(fields, updated_at=time.time())
+            if job["status"] in (DONE, FAILED):
+                self._finish(job_id)
+
+    def set_result(self, job_id, result):
+        with self._lock:
+            self._results[job_id] = result
+            self._jobs[job_id].update(status=DONE, progress=1.0, updated_at=time.time())
+            self._finish(job_id)
+
+    def get_result(self, job_id):
+        with self._lock:
+            return self._results.get(job_id)
+
+    def recover(self):
+        # Nothing survives a restart in memory
+        return 0
+
+    def _finish(self, job_id):
+        # Finished jobs are only kept until max_finished newer ones have finished, so memory stays bounded
+        self._finished[job_id] = None
+        while len(self._finished) > self.max_finished:
+            oldest, _ = self._finished.popitem(last=False)
+            self._jobs.pop(oldest, None)
+            self._results.pop(oldest, None)
+
+
+class SQLiteJobStore:
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    progress REAL NOT NULL,
+                    filename TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    result TEXT,
+                    owner TEXT
+                )"""
+            )
+            columns = [row["name"] for row in self._conn.execute("PRAGMA table_info(jobs)")]
+            if "owner" not in columns:
+                self._conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+
+    def create(self, filename):
+        job = _new_job(filename)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT INTO jobs ({', '.join(_FIELDS)}, owner) VALUES ({', '.join('?' for _ in _FIELDS)}, ?)",
+                [*(job[f] for f in _FIELDS), _owner()],
+            )
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute(f"SELECT {', '.join(_FIELDS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def update(self, job_id, **fields):
+        fields["updated_at"] = time.time()
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock, self._conn:
+            self._conn.execute(f"UPDATE jobs SET {columns} WHERE id = ?", [*fields.values(), job_id])
+
+    def set_result(self, job_id, result):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, progress = 1.0, result = ?, updated_at = ? WHERE id = ?",
+                (DONE, json.dumps(result), time.time(), job_id),
+            )
+
+    def get_result(self, job_id):
+        with self._lock:
+            row = self._conn.execute("SELECT result FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row["result"]) if row and row["result"] is not None else None
+
+    def recover(self):
+        # Jobs that were in flight when their process died lost their upload; mark them failed. Several front-ends
+        # can share the file, so jobs whose process is still running are left alone.
+        with self._lock, self._conn:
+            owners = [
+                row["owner"] for row in self._conn.execute(
+                    "SELECT DISTINCT owner FROM jobs WHERE status IN (?, ?)", (QUEUED, RUNNING)
+                )
+            ]
+            failed = 0
+            for owner in owners:
+                # Recovery runs before this process has created any jobs, so jobs under its own id are from an
+                # earlier process that had the same pid (PID 1 in a restarted container, say)
+                if owner != _owner() and _owner_alive(owner):
+                    continue
+                cursor = self._conn.execute(
+                    "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE status IN (?, ?) AND owner IS ?",
+                    (FAILED, "Interrupted by a server restart", time.time(), QUEUED, RUNNING, owner),
+                )
+                failed += cursor.rowcount
+        return failed
+
+
+def create_store(kind=config.JOB_STORE):
+    if kind == "memory":
+        return MemoryJobStore()
+    if kind == "sqlite":
+        return SQLiteJobStore(config.JOB_DB_PATH)
+    raise ValueError(f"Unknown job store: {kind}")
+
+
+store = create_store()
@@ -0,0 +1,206 @@
+# Request stage timing and Prometheus metrics.
+# Code marks stages with `with metrics.stage("name"):`. When metrics are off no timer is ever installed,
+# so stage() hands back a shared no-op context manager and nothing else runs.
+
+from contextlib import nullcontext
+import contextvars
+import threading
+import time
+
+import config
+
+enabled = config.METRICS_ENABLED
+
+_current_timer = contextvars.ContextVar("request_timer", default=None)
+_noop = nullcontext()
+_metrics = []
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def inc(self, amount=1, **labels):
+        if not enabled:
+            return
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._values = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def observe(self, value, **labels):
+        if not enabled:
+            return
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            state = self._values.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, state in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, state):
+                    labels = _format_labels(self.labelnames, key, [("le", bound)])
+                    lines.append(f"{self.name}_bucket{labels} {count}")
+                labels = _format_labels(self.labelnames, key, [("le", "+Inf")])
+                lines.append(f"{self.name}_bucket{labels} {state[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {state[-2]}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {state[-1]}")
+        return lines
+
+
+class Gauge:
+    # Read from a callback at scrape time, for values other modules already track
+    def __init__(self, name, documentation, read):
+        self.name = name
+        self.documentation = documentation
+        self.read = read
+        _metrics.append(self)
+
+    def render(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge", f"{self.name} {self.read()}"]
+
+
+STAGE_SECONDS = Histogram("whisper_request_stage_seconds", "Time spent per request in each stage", ("stage",))
+REQUEST_SECONDS = Histogram("whisper_request_seconds", "Total request time", ("method", "path", "status"))
+QUEUE_WAIT_SECONDS = Histogram(
+    "whisper_queue_wait_seconds", "Time spent waiting for an inference worker, per priority class", ("priority",)
+)
+REAL_TIME_FACTOR = Histogram(
+    "whisper_real_time_factor", "Seconds from decoded audio to transcript, including queueing, per second of audio",
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 5),
+)
+AUDIO_SECONDS = Counter("whisper_audio_seconds_total", "Seconds of audio transcribed by the model")
+MODEL_CACHE = Counter("whisper_model_cache_total", "Model lookups served warm (hit) or by loading (miss)", ("result",))
+DECODE_WINDOWS = Counter("whisper_decode_windows_total", "Decoder windows (up to 30 seconds of audio each) transcribed")
+FALLBACK_DECODES = Counter(
+    "whisper_fallback_decodes_total", "Extra decodes of a window at a higher temperature after a failed quality check"
+)
+TRANSCRIPT_CACHE = Counter("whisper_transcript_cache_total", "Transcript cache lookups", ("result",))
+
+
+class RequestTimer:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+
+    def add(self, name, seconds):
+        # Stages can repeat (e.g. one per upload chunk); their time adds up
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def header(self):
+        parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.stages.items()]
+        parts.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(parts)
+
+
+class _Stage:
+    __slots__ = ("timer", "name", "started")
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.timer.add(self.name, time.perf_counter() - self.started)
+
+
+def stage(name):
+    timer = _current_timer.get()
+    if timer is None:
+        return _noop
+    return _Stage(timer, name)
+
+
+def record_stage(name, seconds):
+    # For time measured elsewhere, e.g. the pool's queue wait
+    timer = _current_timer.get()
+    if timer is not None:
+        timer.add(name, seconds)
+
+
+def record_decode(stats):
+    # Decode statistics a worker returns with its result; counted here so process and queue workers are included
+    DECODE_WINDOWS.inc(stats["windows"])
+    FALLBACK_DECODES.inc(stats["fallbacks"])
+
+
+def render():
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    # Installs a timer for each HTTP request and reports it in a Server-Timing header
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        timer = RequestTimer()
+        token = _current_timer.set(timer)
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = [*message.get("headers", []), (b"server-timing", timer.header().encode())]
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_timer.reset(token)
+            for name, seconds in timer.stages.items():
+                STAGE_SECONDS.observe(seconds, stage=name)
+            # Label by route template so job ids don't explode the series count
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            REQUEST_SECONDS.observe(time.perf_counter() - timer.started, method=scope["method"], path=path,
+                                    status=status)
@@ -0,0 +1,126 @@
+# Process-wide registry of loaded Whisper models.
+# Each model is loaded once and kept resident until the memory budget forces it out (LRU).
+
+from collections import OrderedDict
+from contextlib import contextmanager
+import threading
+import time
+
+import backends
+import config
+import metrics
+
+
+def _model_size_mb(model):
+    # Weights dominate the footprint, so count parameter bytes, plus the packed weights of quantized
+    # linear layers, which are not parameters
+    total = sum(p.numel() * p.element_size() for p in model.parameters())
+    for module in model.modules():
+        if callable(getattr(module, "weight", None)):
+            weight = module.weight()
+            total += weight.numel() * weight.element_size()
+    return total / (1024 * 1024)
+
+
+class ModelRegistry:
+    def __init__(self, memory_budget_mb=config.MODEL_MEMORY_MB, loader=None):
+        self.memory_budget_mb = memory_budget_mb
+        self._loader = loader
+        self._models = OrderedDict()  # name -> entry dict, oldest use first
+        self._lock = threading.Lock()
+        self._loading = {}  # name -> lock held while that model loads
+        self._in_use = {}  # name -> lock held while that model decodes
+
+    def get(self, name):
+        with self._lock:
+            entry = self._models.get(name)
+            if entry is not None:
+                metrics.MODEL_CACHE.inc(result="hit")
+                return self._touch(name, entry)
+            metrics.MODEL_CACHE.inc(result="miss")
+            load_lock = self._loading.setdefault(name, threading.Lock())
+
+        # Only one caller loads a given model; the others wait for it here
+        with load_lock:
+            with self._lock:
+                entry = self._models.get(name)
+                if entry is not None:
+                    return self._touch(name, entry)
+
+            started = time.perf_counter()
+            try:
+                with metrics.stage("model_load"):
+                    model = (self._loader or backends.get_backend().load)(name)
+            except BaseException:
+                # A failed load (a mistyped name, say) must not stay listed as loading
+                with self._lock:
+                    self._loading.pop(name, None)
+                raise
+            entry = {
+                "model": model,
+                "size_mb": _model_size_mb(model),
+                "load_seconds": time.perf_counter() - started,
+                "loaded_at": time.time(),
+                "last_used": time.time(),
+                "hits": 0,
+            }
+
+            with self._lock:
+                self._models[name] = entry
+                self._loading.pop(name, None)
+                self._evict(keep=name)
+                return model
+
+    @contextmanager
+    def using(self, name):
+        # Whisper installs its decoding hooks on the model itself, so one model object can only run
+        # one decode at a time; parallel decodes of the same model need a process pool
+        model = self.get(name)
+        with self._lock:
+            use_lock = self._in_use.setdefault(name, threading.Lock())
+        with use_lock:
+            yield model
+
+    def preload(self, names):
+        for name in names:
+            self.get(name)
+
+    def status(self):
+        with self._lock:
+            return {
+                "backend": config.BACKEND,
+                "memory_budget_mb": self.memory_budget_mb,
+                "memory_used_mb": round(self._used_mb(), 1),
+                "models": [
+                    {
+                        "name": name,
+                        "size_mb": round(entry["size_mb"], 1),
+                        "load_seconds": round(entry["load_seconds"], 3),
+                        "loaded_at": entry["loaded_at"],
+                        "last_used": entry["last_used"],
+                        "hits": entry["hits"],
+                    }
+                    for name, entry in self._models.items()
+                ],
+                "loading": sorted(self._loading),
+            }
+
+    def _touch(self, name, entry):
+        entry["last_used"] = time.time()
+        entry["hits"] += 1
+        self._models.move_to_end(name)
+        return entry["model"]
+
+    def _used_mb(self):
+        return sum(entry["size_mb"] for entry in self._models.values())
+
+    def _evict(self, keep):
+        # Requests already holding an evicted model keep using it; it is freed once they finish
+        while self._used_mb() > self.memory_budget_mb and len(self._models) > 1:
+            oldest = next(iter(self._models))
+            if oldest == keep:
+                break
+            del self._models[oldest]
+
+
+registry = ModelRegistry()
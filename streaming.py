@@ -0,0 +1,121 @@
+# Incremental transcription of a live recording.
+# Audio arrives as 32-bit float PCM frames; a sliding window of not-yet-final audio is re-decoded as it grows.
+# Segments that end well before the newest audio are finalized and their audio dropped, so the buffer stays bounded.
+
+from collections import OrderedDict
+
+import numpy as np
+
+import config
+from audio import SAMPLE_RATE, resample
+
+# Language detection on a second or two of audio is unreliable; it is only kept from a window at least this long
+DETECT_SECONDS = 5.0
+
+# Last language detected per record-mode session (one browser tab), so its next recording skips detection too
+_languages = OrderedDict()
+_MAX_SESSIONS = 1024
+
+
+def remembered_language(session_id):
+    return _languages.get(session_id) if session_id else None
+
+
+def remember_language(session_id, language):
+    if session_id and language:
+        _languages[session_id] = language
+        _languages.move_to_end(session_id)
+        while len(_languages) > _MAX_SESSIONS:
+            _languages.popitem(last=False)
+
+
+class LiveSession:
+    def __init__(self, decode, language=None, step=config.STREAM_STEP_SECONDS, window=config.STREAM_WINDOW_SECONDS,
+                 holdback=config.STREAM_HOLDBACK_SECONDS):
+        # decode is a coroutine function taking a 16 kHz float32 array and a language (None to detect it),
+        # returning the detected language and segments
+        self._decode = decode
+        self.language = language
+        self.step = step
+        self.window = window
+        self.holdback = holdback
+        # Browsers that ignore the requested rate send their native one. The buffer stays at that rate and the
+        # window is resampled as a whole before each decode: resampling frame by frame would restart the filter at
+        # every frame edge and round each frame's length, so timestamps would drift.
+        self.input_rate = SAMPLE_RATE
+        self._buffer = np.zeros(0, dtype=np.float32)
+        self._offset = 0.0  # session time of the first buffered sample
+        self._pending = 0  # samples received since the last decode
+        self.dropped_seconds = 0.0
+
+    @property
+    def buffered_seconds(self):
+        return len(self._buffer) / self.input_rate
+
+    def feed(self, frame):
+        samples = np.frombuffer(frame, dtype=np.float32)
+        self._buffer = np.concatenate([self._buffer, samples])
+        self._pending += len(samples)
+
+        # Hard cap in case decoding falls far behind: the oldest audio is lost rather than memory growing
+        limit = int(2 * self.window * self.input_rate)
+        if len(self._buffer) > limit:
+            excess = len(self._buffer) - limit
+            self._buffer = self._buffer[excess:]
+            self._offset += excess / self.input_rate
+            self.dropped_seconds += excess / self.input_rate
+
+    def ready(self):
+        return self._pending >= self.step * self.input_rate or self.buffered_seconds >= self.window
+
+    async def update(self):
+        # Decode the window; returns finalized segments and the text still subject to change
+        if not len(self._buffer):
+            return [], ""
+        self._pending = 0
+        segments = await self._decode_window()
+
+        # A full window has to be flushed whole, otherwise keep the tail open
+        if self.buffered_seconds >= self.window:
+            cutoff = len(segments)
+        else:
+            horizon = self.buffered_seconds - self.holdback
+            cutoff = 0
+            while cutoff < len(segments) - 1 and segments[cutoff]["end"] <= horizon:
+                cutoff += 1
+
+        final = [self._absolute(segment) for segment in segments[:cutoff]]
+        partial = "".join(segment["text"] for segment in segments[cutoff:]).strip()
+        if cutoff == len(segments):
+            self._advance(self.buffered_seconds)
+        elif cutoff:
+            self._advance(segments[cutoff - 1]["end"])
+        return final, partial
+
+    async def finish(self):
+        # Everything left is final once the recording stops
+        if not len(self._buffer):
+            return []
+        segments = await self._decode_window()
+        final = [self._absolute(segment) for segment in segments]
+        self._advance(self.buffered_seconds)
+        return final
+
+    async def _decode_window(self):
+        # The window is re-decoded every step, so detecting the language once instead of every time saves a pass
+        result = await self._decode(resample(self._buffer, self.input_rate), self.language)
+        if self.language is None and result["segments"] and self.buffered_seconds >= DETECT_SECONDS:
+            self.language = result["language"]
+        return result["segments"]
+
+    def _absolute(self, segment):
+        return {
+            "start": round(self._offset + segment["start"], 2),
+            "end": round(self._offset + segment["end"], 2),
+            "text": segment["text"].strip(),
+        }
+
+    def _advance(self, seconds):
+        samples = min(len(self._buffer), int(round(seconds * self.input_rate)))
+        self._buffer = self._buffer[samples:]
+        self._offset += samples / self.input_rate
@@ -0,0 +1,225 @@
+# Task queue shared by the web front-ends and the inference workers in multi-process mode (WHISPER_POOL=queue).
+# Front-ends enqueue pickled (function, args) calls; the workers started by inference_worker.py claim them oldest
+# first, run them and store the pickled result. It is a SQLite file in WAL mode, so any number of processes on one
+# host can use it at once, and there is no broker to run.
+
+from concurrent.futures import Executor, Future
+import pickle
+import sqlite3
+import threading
+import time
+
+import config
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# A worker that hasn't sent a heartbeat for this long is considered gone
+WORKER_TIMEOUT_SECONDS = 10
+
+
+class TaskQueue:
+    def __init__(self, path=config.QUEUE_DB_PATH):
+        # One connection per process: connections must not be carried across fork
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS tasks (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    status TEXT NOT NULL,
+                    payload BLOB,
+                    result BLOB,
+                    error TEXT,
+                    worker TEXT,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL
+                )"""
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, id)")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS workers (
+                    id TEXT PRIMARY KEY,
+                    pid INTEGER NOT NULL,
+                    started_at REAL NOT NULL,
+                    last_seen REAL NOT NULL
+                )"""
+            )
+
+    def put(self, payload):
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO tasks (status, payload, created_at) VALUES (?, ?, ?)", (QUEUED, payload, time.time())
+            )
+        return cursor.lastrowid
+
+    def claim(self, worker_id):
+        # A single UPDATE ... RETURNING, so two workers can never claim the same task
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                """UPDATE tasks SET status = ?, worker = ?, started_at = ?
+                WHERE id = (SELECT id FROM tasks WHERE status = ? ORDER BY id LIMIT 1)
+                RETURNING id, payload""",
+                (RUNNING, worker_id, time.time(), QUEUED),
+            ).fetchone()
+        return row
+
+    def finish(self, task_id, result):
+        self._set_outcome(task_id, DONE, result, None)
+
+    def fail(self, task_id, exception, error):
+        self._set_outcome(task_id, FAILED, exception, error)
+
+    def finished(self, task_ids):
+        # (id, status, result, error) for those of the given tasks that are done or failed; the payload is dropped
+        # with the row once the caller has the result
+        if not task_ids:
+            return []
+        marks = ",".join("?" * len(task_ids))
+        with self._lock, self._conn:
+            rows = self._conn.execute(
+                f"SELECT id, status, result, error FROM tasks WHERE id IN ({marks}) AND status IN (?, ?)",
+                (*task_ids, DONE, FAILED),
+            ).fetchall()
+            if rows:
+                done = [row[0] for row in rows]
+                self._conn.execute(f"DELETE FROM tasks WHERE id IN ({','.join('?' * len(done))})", done)
+        return rows
+
+    def cancel(self, task_ids):
+        # Tasks nobody waits for any more: drop them, and let a worker that already runs one discard its result
+        if task_ids:
+            with self._lock, self._conn:
+                self._conn.execute(f"DELETE FROM tasks WHERE id IN ({','.join('?' * len(task_ids))})", task_ids)
+
+    def fail_worker(self, worker_id, error):
+        # A worker died mid-task; its callers get an error rather than waiting forever
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE tasks SET status = ?, error = ?, finished_at = ? WHERE worker = ? AND status = ?",
+                (FAILED, error, time.time(), worker_id, RUNNING),
+            )
+            self._conn.execute("DELETE FROM workers WHERE id = ?", (worker_id,))
+
+    def purge(self, older_than):
+        # Results whose front-end went away before collecting them
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "DELETE FROM tasks WHERE status IN (?, ?) AND finished_at < ?",
+                (DONE, FAILED, time.time() - older_than),
+            )
+        return cursor.rowcount
+
+    def heartbeat(self, worker_id, pid, started_at):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO workers (id, pid, started_at, last_seen) VALUES (?, ?, ?, ?)",
+                (worker_id, pid, started_at, time.time()),
+            )
+
+    def live_workers(self):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM workers WHERE last_seen > ?", (time.time() - WORKER_TIMEOUT_SECONDS,)
+            ).fetchone()[0]
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT status, COUNT(*) FROM tasks GROUP BY status").fetchall())
+        return {
+            "queued": counts.get(QUEUED, 0),
+            "running": counts.get(RUNNING, 0),
+            "live_workers": self.live_workers(),
+        }
+
+    def _set_outcome(self, task_id, status, result, error):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE tasks SET status = ?, payload = NULL, result = ?, error = ?, finished_at = ? WHERE id = ?",
+                (status, result, error, time.time(), task_id),
+            )
+
+
+class QueueExecutor(Executor):
+    # concurrent.futures executor that runs calls on the inference workers, so the pool can use it like its thread
+    # and process executors. Enqueueing (pickling the audio) and polling for results happen on one background thread,
+    # never on the event loop.
+    def __init__(self, queue, poll_interval=config.QUEUE_POLL_MS / 1000):
+        self.queue = queue
+        self.poll_interval = poll_interval
+        self._outgoing = []  # (future, fn, args, kwargs) not yet in the queue
+        self._pending = {}  # task id -> future
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="task-queue", daemon=True)
+        self._thread.start()
+
+    def submit(self, fn, /, *args, **kwargs):
+        future = Future()
+        with self._lock:
+            if self._stopped:
+                raise RuntimeError("cannot schedule new futures after shutdown")
+            self._outgoing.append((future, fn, args, kwargs))
+        self._wakeup.set()
+        return future
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        with self._lock:
+            self._stopped = True
+            if cancel_futures:
+                for future, *_ in self._outgoing:
+                    future.cancel()
+                for future in self._pending.values():
+                    future.cancel()
+        self._wakeup.set()
+        if wait:
+            self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                outgoing, self._outgoing = self._outgoing, []
+                stopped = self._stopped
+            for future, fn, args, kwargs in outgoing:
+                if future.cancelled():
+                    continue
+                try:
+                    task_id = self.queue.put(pickle.dumps((fn, args, kwargs), protocol=pickle.HIGHEST_PROTOCOL))
+                except Exception as e:
+                    if future.set_running_or_notify_cancel():
+                        future.set_exception(e)
+                    continue
+                with self._lock:
+                    self._pending[task_id] = future
+
+            with self._lock:
+                pending = dict(self._pending)
+            if stopped and not any(not future.cancelled() for future in pending.values()):
+                self.queue.cancel(list(pending))
+                return
+
+            cancelled = [task_id for task_id, future in pending.items() if future.cancelled()]
+            self.queue.cancel(cancelled)
+            for task_id, status, result, error in self.queue.finished([t for t in pending if t not in cancelled]):
+                self._resolve(pending[task_id], status, result, error)
+            with self._lock:
+                for task_id, future in pending.items():
+                    if future.done():
+                        self._pending.pop(task_id, None)
+
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def _resolve(self, future, status, result, error):
+        if not future.set_running_or_notify_cancel():
+            return
+        if status == DONE:
+            future.set_result(pickle.loads(result))
+        else:
+            # The worker's exception, or just its message if the worker died or the exception couldn't be pickled
+            future.set_exception(pickle.loads(result) if result is not None else RuntimeError(error))
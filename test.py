@@ -1,14 +1,80 @@
 # A web interface for Whisper that allows you to upload audio files and get the transcript.
 # Run uvicorn test:app --reload
 
-from fastapi import FastAPI, File, UploadFile
-from fastapi.responses import HTMLResponse
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI, File, Header, HTTPException, Request, UploadFile, WebSocket
+from fastapi.responses import HTMLResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
-import whisper
-import tempfile
+import asyncio
+import hashlib
+import json
 import os
+import time
+import uuid
 
-app = FastAPI()
+import audio
+import config
+import decoding
+import formats
+import jobs
+import metrics
+import transcripts
+from audio import SAMPLE_RATE
+from batching import WINDOW_SAMPLES, MicroBatcher
+from cache import cache, cache_key
+from chunking import stream_windows, transcribe_chunked, transcribe_sequential
+from inference import decode_batch, transcribe_audio, transcribe_segments, warm_up_models
+from models import registry
+from streaming import LiveSession, remember_language, remembered_language
+from uploads import UploadLimitMiddleware, hash_upload, save_upload
+from workers import BULK, INTERACTIVE, PRIORITIES, PoolFull, classify, pool, schedule_as
+
+
+# Filled in by the background warm-up and reported by /readyz
+startup = {"ready": False, "error": None, "warm_up_seconds": None}
+
+
+async def warm_up():
+    # Load the configured models and run a short decode on each while the server already answers /, /static and
+    # /healthz. Process workers are forked afterwards and start with the warmed models already in memory.
+    # In multi-process mode (WHISPER_POOL=queue) the models live in the inference workers instead
+    models = [] if pool.kind == "queue" else config.PRELOAD_MODELS
+    started = time.perf_counter()
+    try:
+        await asyncio.to_thread(warm_up_models, models)
+    except Exception as e:
+        startup["error"] = f"{type(e).__name__}: {e}"
+        return
+    pool.start()
+    startup["warm_up_seconds"] = round(time.perf_counter() - started, 3)
+    startup["ready"] = True
+
+
+@asynccontextmanager
+async def lifespan(app):
+    jobs.store.recover()
+    warm_up_task = asyncio.create_task(warm_up())
+    yield
+    warm_up_task.cancel()
+    batcher.stop()
+    pool.shutdown()
+
+async def run_batch(key, audios):
+    # Short clips from concurrent requests share one batched decode in the pool; the key is the model and decode
+    # options. The clips are all short, so the batch is interactive work.
+    schedule_as(INTERACTIVE)
+    if len(audios) == 1:
+        # Nothing to share a pass with: the full decode, with segment and word timings and temperature fallback
+        return [await pool.submit(transcribe_audio, key[0], audios[0], None, dict(key[1]))]
+    return await pool.submit(decode_batch, key[0], audios, dict(key[1]))
+
+
+batcher = MicroBatcher(run_batch)
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(UploadLimitMiddleware)
+if metrics.enabled:
+    app.add_middleware(metrics.MetricsMiddleware)
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 @app.get("/", response_class=HTMLResponse)
@@ -137,6 +203,10 @@ async def root():
                         transform: translateY(0);
                     }
                     
+                    .transcription-entry .partial {
+                        color: #999;
+                    }
+                    
                     /* Toggle switch styles */
                     .toggle-container {
                         margin: 20px 0;
@@ -204,6 +274,21 @@ async def root():
                     .mode-section.active {
                         display: block;
                     }
+                    
+                    .history-search {
+                        width: 100%;
+                        padding: 10px;
+                        border: 1px solid #ddd;
+                        border-radius: 5px;
+                        font-size: 16px;
+                        box-sizing: border-box;
+                    }
+                    
+                    .transcription-entry .meta {
+                        color: #999;
+                        font-size: 12px;
+                        margin-bottom: 5px;
+                    }
 
                 </style>
             </head>
@@ -249,12 +334,23 @@ async def root():
                         <div class="transcription-container" id="upload-transcription-container" style="display: none;">
                             <h2>Transcriptions</h2>
                             <img src="/static/spinner_green.gif" class="spinner" id="upload-spinner">
+                            <div id="upload-progress" style="color: #666;"></div>
                             <div id="upload-transcriptions"></div>
                         </div>
                     </div>
+                    
+                    <div class="transcription-container" id="history-container" style="display: none;">
+                        <h2>Past transcriptions</h2>
+                        <input type="search" id="history-search" class="history-search"
+                               placeholder="Search what was said">
+                        <div id="history"></div>
+                        <button id="history-more" class="submit-btn" style="display: none;">Load more</button>
+                    </div>
                 </div>
 
                 <script>
+                    // Files longer than this are transcribed as background jobs
+                    const LONG_FILE_SECONDS = __LONG_FILE_SECONDS__;
                     const dropZone = document.getElementById('drop-zone');
                     const fileInput = document.getElementById('file-input');
                     const fileName = document.getElementById('file-name');
@@ -287,8 +383,11 @@ async def root():
                         }
                     }
 
-                    let mediaRecorder;
-                    let audioChunks = [];
+                    let mediaStream;
+                    let audioContext;
+                    let audioProcessor;
+                    let socket;
+                    let liveEntry;
                     let isRecording = false;
                     let startTime;
                     let timerInterval;
@@ -296,51 +395,76 @@ async def root():
                     const recordButton = document.getElementById('recordButton');
                     const timer = document.getElementById('timer');
                     
+                    // Entry that fills in while recording: finalized text in black, the still-changing tail in grey
+                    function createLiveEntry() {
+                        const transcriptionDiv = document.createElement('div');
+                        transcriptionDiv.className = 'transcription-entry';
+                        const finalSpan = document.createElement('span');
+                        const partialSpan = document.createElement('span');
+                        partialSpan.className = 'partial';
+                        transcriptionDiv.append(finalSpan, partialSpan);
+                        document.getElementById('transcriptions').prepend(transcriptionDiv);
+                        
+                        // Trigger animation
+                        setTimeout(() => {
+                            transcriptionDiv.classList.add('show');
+                        }, 10);
+                        
+                        return { finalSpan, partialSpan };
+                    }
+                    
+                    function handleLiveMessage(event) {
+                        const message = JSON.parse(event.data);
+                        
+                        if (message.type === 'final') {
+                            liveEntry.finalSpan.textContent += (liveEntry.finalSpan.textContent ? ' ' : '') + message.text;
+                            liveEntry.partialSpan.textContent = '';
+                        } else if (message.type === 'partial') {
+                            liveEntry.partialSpan.textContent = message.text ? ' ' + message.text : '';
+                        } else if (message.type === 'done') {
+                            socket.close();
+                            loadHistory();
+                        }
+                    }
+                    
                     async function startRecording() {
                         try {
-                            const stream = await navigator.mediaDevices.getUserMedia({ audio: true });
-                            mediaRecorder = new MediaRecorder(stream);
-                            audioChunks = [];
+                            mediaStream = await navigator.mediaDevices.getUserMedia({ audio: true });
                             
-                            mediaRecorder.ondataavailable = (event) => {
-                                audioChunks.push(event.data);
+                            // Stream raw 16 kHz samples to the server so text appears while still talking
+                            // With a session id the server reuses the language detected in this tab's last recording
+                            if (!sessionStorage.getItem('whisper-session')) {
+                                sessionStorage.setItem('whisper-session', Math.random().toString(36).slice(2));
+                            }
+                            const session = sessionStorage.getItem('whisper-session');
+                            const protocol = location.protocol === 'https:' ? 'wss' : 'ws';
+                            socket = new WebSocket(`${protocol}://${location.host}/ws/transcribe?session=${session}`);
+                            socket.onmessage = handleLiveMessage;
+                            socket.onclose = () => {
+                                // Hide spinner once the server is done, or on error
+                                document.getElementById('spinner').style.display = 'none';
                             };
                             
-                            mediaRecorder.onstop = async () => {
-                                const audioBlob = new Blob(audioChunks, { type: 'audio/wav' });
-                                const formData = new FormData();
-                                formData.append('file', audioBlob, 'recording.wav');
-                                
-                                try {
-                                    const response = await fetch('/transcribe', {
-                                        method: 'POST',
-                                        body: formData
-                                    });
-                                    
-                                    const result = await response.text();
-                                    
-                                    // Hide spinner
-                                    document.getElementById('spinner').style.display = 'none';
-                                    
-                                    // Add transcription with animation
-                                    const transcriptionDiv = document.createElement('div');
-                                    transcriptionDiv.className = 'transcription-entry';
-                                    transcriptionDiv.textContent = result;
-                                    document.getElementById('transcriptions').prepend(transcriptionDiv);
-                                    
-                                    // Trigger animation
-                                    setTimeout(() => {
-                                        transcriptionDiv.classList.add('show');
-                                    }, 10);
-                                    
-                                } catch (error) {
-                                    console.error('Error:', error);
-                                    // Hide spinner on error too
-                                    document.getElementById('spinner').style.display = 'none';
-                                }
+                            audioContext = new AudioContext({ sampleRate: 16000 });
+                            const source = audioContext.createMediaStreamSource(mediaStream);
+                            audioProcessor = audioContext.createScriptProcessor(4096, 1, 1);
+                            
+                            socket.onopen = () => {
+                                socket.send(JSON.stringify({ type: 'start', sample_rate: audioContext.sampleRate }));
+                                audioProcessor.onaudioprocess = (event) => {
+                                    if (socket.readyState === WebSocket.OPEN) {
+                                        socket.send(new Float32Array(event.inputBuffer.getChannelData(0)));
+                                    }
+                                };
                             };
                             
-                            mediaRecorder.start(1000);
+                            source.connect(audioProcessor);
+                            audioProcessor.connect(audioContext.destination);
+                            
+                            // Show transcription container with an entry that fills in live
+                            document.getElementById('transcription-container').style.display = 'block';
+                            liveEntry = createLiveEntry();
+                            
                             startTime = Date.now();
                             updateTimer();
                             timerInterval = setInterval(updateTimer, 1000);
@@ -356,18 +480,22 @@ async def root():
                     }
                     
                     function stopRecording() {
-                        if (mediaRecorder && mediaRecorder.state !== 'inactive') {
-                            mediaRecorder.stop();
-                            mediaRecorder.stream.getTracks().forEach(track => track.stop());
+                        if (isRecording) {
+                            audioProcessor.onaudioprocess = null;
+                            audioProcessor.disconnect();
+                            audioContext.close();
+                            mediaStream.getTracks().forEach(track => track.stop());
                             clearInterval(timerInterval);
                             recordButton.textContent = 'Start Recording';
                             recordButton.classList.remove('recording');
                             isRecording = false;
                             timer.textContent = '00:00';
                             
-                            // Show transcription container and spinner
-                            document.getElementById('transcription-container').style.display = 'block';
-                            document.getElementById('spinner').style.display = 'block';
+                            // Ask for the rest of the audio to be finalized and show the spinner until it is
+                            if (socket.readyState === WebSocket.OPEN) {
+                                socket.send(JSON.stringify({ type: 'stop' }));
+                                document.getElementById('spinner').style.display = 'block';
+                            }
                         }
                     }
                     
@@ -422,6 +550,141 @@ async def root():
                         }
                     });
                     
+                    // Past transcriptions from the archive, a page at a time; with a query, the matching segments
+                    const historyList = document.getElementById('history');
+                    const historySearch = document.getElementById('history-search');
+                    const historyMore = document.getElementById('history-more');
+                    let historyNext = null;
+                    
+                    function formatOffset(ms) {
+                        const seconds = Math.floor(ms / 1000);
+                        return `${Math.floor(seconds / 60)}:${String(seconds % 60).padStart(2, '0')}`;
+                    }
+                    
+                    async function loadHistory(more = false) {
+                        const query = historySearch.value.trim();
+                        const params = new URLSearchParams({ limit: 20 });
+                        if (query) {
+                            params.set('q', query);
+                        }
+                        if (more && historyNext !== null) {
+                            params.set('before', historyNext);
+                        }
+                        const response = await fetch(`/transcripts${query ? '/search' : ''}?${params}`);
+                        if (!response.ok) {
+                            // The archive is turned off, or the query was rejected
+                            if (!query) {
+                                document.getElementById('history-container').style.display = 'none';
+                            }
+                            return;
+                        }
+                        const page = await response.json();
+                        if (!more) {
+                            historyList.textContent = '';
+                        }
+                        for (const item of page.items) {
+                            const entry = document.createElement('div');
+                            entry.className = 'transcription-entry show';
+                            const meta = document.createElement('div');
+                            meta.className = 'meta';
+                            const when = new Date(item.created_at * 1000).toLocaleString();
+                            meta.textContent = query
+                                ? `${item.filename || 'Recording'} at ${formatOffset(item.start_ms)} · ${when}`
+                                : `${item.filename || 'Recording'} · ${when}`;
+                            entry.appendChild(meta);
+                            entry.appendChild(document.createTextNode(query ? item.text : item.preview));
+                            historyList.appendChild(entry);
+                        }
+                        historyNext = page.next;
+                        historyMore.style.display = page.next === null ? 'none' : 'inline-block';
+                        document.getElementById('history-container').style.display = 'block';
+                    }
+                    
+                    let searchTimer = null;
+                    historySearch.addEventListener('input', () => {
+                        clearTimeout(searchTimer);
+                        searchTimer = setTimeout(() => loadHistory(), 300);
+                    });
+                    historyMore.addEventListener('click', () => loadHistory(true));
+                    loadHistory();
+                    
+                    // Length of an audio file from its metadata, or NaN if the browser can't tell
+                    function audioDuration(file) {
+                        return new Promise((resolve) => {
+                            const probe = document.createElement('audio');
+                            probe.preload = 'metadata';
+                            probe.onloadedmetadata = () => {
+                                URL.revokeObjectURL(probe.src);
+                                resolve(probe.duration);
+                            };
+                            probe.onerror = () => {
+                                URL.revokeObjectURL(probe.src);
+                                resolve(NaN);
+                            };
+                            probe.src = URL.createObjectURL(file);
+                        });
+                    }
+                    
+                    // Segments arrive one JSON object per line as soon as they are decoded
+                    async function transcribeStreaming(formData, transcriptionDiv, progress) {
+                        const response = await fetch('/transcribe/stream', {
+                            method: 'POST',
+                            body: formData
+                        });
+                        
+                        if (!response.ok) {
+                            throw new Error(`Upload failed: ${response.status}`);
+                        }
+                        
+                        const reader = response.body.getReader();
+                        const decoder = new TextDecoder();
+                        let buffered = '';
+                        
+                        while (true) {
+                            const { value, done } = await reader.read();
+                            if (done) {
+                                break;
+                            }
+                            buffered += decoder.decode(value, { stream: true });
+                            const lines = buffered.split('\\n');
+                            buffered = lines.pop();
+                            
+                            for (const line of lines.filter(line => line.trim())) {
+                                const message = JSON.parse(line);
+                                if (message.type === 'segment') {
+                                    transcriptionDiv.textContent += message.text;
+                                } else if (message.type === 'done') {
+                                    transcriptionDiv.textContent = message.text;
+                                }
+                                progress.textContent = `${Math.round(message.progress * 100)}%`;
+                            }
+                        }
+                    }
+                    
+                    // Long files run as a background job: its pieces are decoded in parallel and no connection
+                    // has to stay open until the end
+                    async function transcribeAsJob(formData, transcriptionDiv, progress) {
+                        const response = await fetch('/jobs', {
+                            method: 'POST',
+                            body: formData
+                        });
+                        
+                        if (!response.ok) {
+                            throw new Error(`Upload failed: ${response.status}`);
+                        }
+                        
+                        let job = await response.json();
+                        while (job.status === 'queued' || job.status === 'running') {
+                            progress.textContent = `${Math.round(job.progress * 100)}%`;
+                            await new Promise(resolve => setTimeout(resolve, 1000));
+                            job = await (await fetch(`/jobs/${job.id}`)).json();
+                        }
+                        if (job.status !== 'done') {
+                            throw new Error(job.error || `Job ${job.status}`);
+                        }
+                        transcriptionDiv.textContent = await (await fetch(`/jobs/${job.id}/result?format=text`)).text();
+                    }
+                    
                     // Handle file upload form submission
                     document.getElementById('upload-form').addEventListener('submit', async (e) => {
                         e.preventDefault();
@@ -436,22 +699,14 @@ async def root():
                         document.getElementById('upload-spinner').style.display = 'block';
                         
                         const formData = new FormData(e.target);
+                        const progress = document.getElementById('upload-progress');
+                        
+                        // Add transcription with animation; it fills in as the transcript arrives
+                        const transcriptionDiv = document.createElement('div');
+                        transcriptionDiv.className = 'transcription-entry';
                         
                         try {
-                            const response = await fetch('/transcribe', {
-                                method: 'POST',
-                                body: formData
-                            });
-                            
-                            const result = await response.text();
-                            
-                            // Hide spinner
-                            document.getElementById('upload-spinner').style.display = 'none';
-                            
-                            // Add transcription with animation
-                            const transcriptionDiv = document.createElement('div');
-                            transcriptionDiv.className = 'transcription-entry';
-                            transcriptionDiv.textContent = result;
+                            const duration = await audioDuration(fileInput.files[0]);
                             document.getElementById('upload-transcriptions').prepend(transcriptionDiv);
                             
                             // Trigger animation
@@ -459,6 +714,17 @@ async def root():
                                 transcriptionDiv.classList.add('show');
                             }, 10);
                             
+                            if (duration > LONG_FILE_SECONDS) {
+                                await transcribeAsJob(formData, transcriptionDiv, progress);
+                            } else {
+                                await transcribeStreaming(formData, transcriptionDiv, progress);
+                            }
+                            
+                            // Hide spinner
+                            document.getElementById('upload-spinner').style.display = 'none';
+                            progress.textContent = '';
+                            loadHistory();
+                            
                             // Reset file input
                             fileInput.value = '';
                             fileName.textContent = '';
@@ -466,7 +732,9 @@ async def root():
                         } catch (error) {
                             console.error('Error:', error);
                             // Hide spinner on error
+                            transcriptionDiv.remove();
                             document.getElementById('upload-spinner').style.display = 'none';
+                            progress.textContent = '';
                             alert('Error processing file. Please try again.');
                         }
                     });
@@ -474,23 +742,454 @@ async def root():
                 </script>
             </body>
         </html>
-    '''
+    '''.replace("__LONG_FILE_SECONDS__", str(config.LONG_FILE_SECONDS))
+
+def render_result(result, format=None, accept="", transcript_id=None):
+    # ?format= or the Accept header picks text, json, srt or vtt; without either, plain text served as HTML
+    try:
+        fmt = formats.negotiate(format, accept)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    headers = {"X-Transcript-Id": transcript_id} if transcript_id else None
+    if fmt is None:
+        return HTMLResponse(formats.render(result, "text")[0], headers=headers)
+    body, media_type = formats.render(result, fmt)
+    return Response(body, media_type=media_type, headers=headers)
+
+
+def decode_options(request: Request, x_client_id: str = Header(default="")):
+    # language, task, beam_size, temperature and condition_on_previous_text from the query string, on top of the
+    # client's profile (see decoding.py)
+    try:
+        return decoding.resolve(x_client_id, request.query_params)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+async def request_class(request: Request, x_priority: str = Header(default=""), x_client_id: str = Header(default="")):
+    # Scheduling class (X-Priority, otherwise decided by audio length) and the client whose requests share a fair turn
+    # (X-Client-Id, otherwise the address). Async, so the context it sets is the one the endpoint runs in.
+    if x_priority and x_priority not in PRIORITIES:
+        raise HTTPException(status_code=400, detail=f"X-Priority must be one of {', '.join(PRIORITIES)}")
+    client = x_client_id or (request.client.host if request.client else None)
+    schedule_as(x_priority or None, client)
+    return x_priority or None, client
+
+
+@app.post("/transcribe", response_class=HTMLResponse, dependencies=[Depends(request_class)])
+async def transcribe(file: UploadFile = File(...), format: str = None, accept: str = Header(default=""),
+                     options: dict = Depends(decode_options)):
+    hasher = hashlib.sha256()
+    await hash_upload(file, hasher)
+
+    try:
+        # Decoded straight from the spooled upload; there is no temporary file to clean up
+        key, result = await transcribe_cached(file.file, hasher.hexdigest(), options)
+        await archive(key, hasher.hexdigest(), config.DEFAULT_MODEL, result, file.filename, options)
+
+        # Plain transcription text unless another format was asked for
+        return render_result(result, format, accept, transcript_id=key)
+    except PoolFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+
+async def archive(transcript_id, audio_digest, model_name, result, filename=None, options=None):
+    # Keep the result in the searchable archive (transcripts.py), unless it is turned off. Saving is idempotent,
+    # so cache hits and re-uploads don't add copies. Off the event loop: the insert waits for any running search.
+    if transcripts.store:
+        await asyncio.to_thread(
+            transcripts.store.save, transcript_id, audio_digest, model_name, result, filename, options
+        )
+
+
+def archive_store():
+    if not transcripts.store:
+        raise HTTPException(status_code=404, detail="The transcript archive is turned off")
+    return transcripts.store
+
 
-@app.post("/transcribe", response_class=HTMLResponse)
-async def transcribe(file: UploadFile = File(...)):
-    # Save uploaded file temporarily
-    with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-        content = await file.read()
-        temp_file.write(content)
-        temp_path = temp_file.name
+@app.get("/transcripts")
+async def list_transcripts(limit: int = 50, before: int = None, model: str = None, audio_hash: str = None):
+    # Archived transcripts newest first, with the start of their text; pass "next" back as before for the next page
+    return await asyncio.to_thread(archive_store().recent, limit, before, model, audio_hash)
 
+
+@app.get("/transcripts/search")
+async def search_transcripts(q: str, limit: int = 50, before: int = None, model: str = None, audio_hash: str = None):
+    # Archived segments containing every word of q (word* matches a prefix), newest first, with their offsets in
+    # milliseconds; pass "next" back as before for the next page
     try:
-        # Transcribe the audio
-        model = whisper.load_model("base")
-        result = model.transcribe(temp_path)
-        
-        # Always return just the transcription text
-        return f'{result["text"]}'
+        return await asyncio.to_thread(archive_store().search, q, limit, before, model, audio_hash)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/transcripts/{transcript_id}")
+async def get_transcript(transcript_id: str, format: str = None, accept: str = Header(default="")):
+    # Any format of an earlier result (X-Transcript-Id) without decoding again, from the cache or the archive;
+    # JSON by default
+    result = await cache.get_async(transcript_id)
+    if result is None and transcripts.store:
+        result = await asyncio.to_thread(transcripts.store.get, transcript_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Transcript not found")
+    if not format and formats.negotiate(None, accept) is None:
+        format = "json"
+    return render_result(result, format, accept)
+
+
+@app.get("/transcripts/{transcript_id}/segments")
+async def get_transcript_segments(transcript_id: str, limit: int = 100, after: int = None):
+    # A page of an archived transcript's segments in order; pass "next" back as after for the following page
+    page = await asyncio.to_thread(archive_store().segments, transcript_id, limit, after)
+    if page is None:
+        raise HTTPException(status_code=404, detail="Transcript not found")
+    return page
+
+
+@app.post("/transcribe/stream", dependencies=[Depends(request_class)])
+async def transcribe_stream(request: Request, file: UploadFile = File(...), options: dict = Depends(decode_options)):
+    # Segments are sent as soon as they are decoded, with a percent-complete value:
+    # one JSON object per line by default, Server-Sent Events if the client accepts text/event-stream
+    hasher = hashlib.sha256()
+    await hash_upload(file, hasher)
+    key = result_key(hasher.hexdigest(), config.DEFAULT_MODEL, options)
+    cached = await cache.get_async(key)
+    metrics.TRANSCRIPT_CACHE.inc(result="miss" if cached is None else "hit")
+
+    samples = None
+    if cached is None:
+        # Refuse before the stream starts; once it has, the status code can't change
+        try:
+            pool.check_admission()
+        except PoolFull as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+        # Decode now: the upload is closed once the handler returns
+        with metrics.stage("audio_decode"):
+            samples = await audio.decode(file.file)
+        classify(len(samples) / SAMPLE_RATE)
+
+    async def events():
+        if cached is not None:
+            yield {"type": "done", "id": key, "text": cached["text"], "language": cached["language"], "progress": 1.0}
+            return
+        started = time.perf_counter()
+        pieces = []
+        windows = stream_windows(samples, piece_decoder(config.DEFAULT_MODEL, options))
+        async for piece, progress in windows:
+            metrics.record_decode(piece["decode"])
+            pieces.append(piece)
+            for segment in piece["segments"]:
+                yield {"type": "segment", **segment, "progress": round(progress, 3)}
+            if not piece["segments"]:
+                yield {"type": "progress", "progress": round(progress, 3)}
+        duration = len(samples) / SAMPLE_RATE
+        result = formats.merge(pieces, duration)
+        await cache.put_async(key, result)
+        await archive(key, hasher.hexdigest(), config.DEFAULT_MODEL, result, file.filename, options)
+        if duration:
+            metrics.AUDIO_SECONDS.inc(duration)
+            metrics.REAL_TIME_FACTOR.observe((time.perf_counter() - started) / duration)
+        yield {"type": "done", "id": key, "text": result["text"], "language": result["language"], "progress": 1.0}
+
+    if "text/event-stream" in request.headers.get("accept", ""):
+        body = (f"event: {event['type']}\ndata: {json.dumps(event)}\n\n" async for event in events())
+        return StreamingResponse(body, media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+    body = (json.dumps(event) + "\n" async for event in events())
+    return StreamingResponse(body, media_type="application/x-ndjson")
+
+
+def result_key(audio_digest, model_name, options, batched=False):
+    # Everything that changes the result has to be part of the key, including the decode path: a batched decode
+    # has one segment per clip and no word timings
+    if batched:
+        return cache_key(audio_digest, model_name, {"backend": config.BACKEND, "path": "batch", **options})
+    return cache_key(
+        audio_digest,
+        model_name,
+        {"backend": config.BACKEND, "word_timestamps": config.WORD_TIMESTAMPS, **options},
+    )
+
+
+# Transcriptions in progress, as a sign of load when deciding whether a batched cache entry will do
+_in_flight = 0
+
+
+async def transcribe_cached(source, audio_digest, options, model_name=config.DEFAULT_MODEL, progress=None):
+    # Re-uploads of the same recording are answered from the cache without touching the model.
+    # Returns the cache key, which doubles as the transcript id, and the result.
+    global _in_flight
+    _in_flight += 1
+    try:
+        key = result_key(audio_digest, model_name, options)
+        result = await cache.get_async(key)
+        if result is None and batcher.enabled and not options["beam_size"] and _in_flight > 1:
+            # Under load a short clip would be batched again anyway, so an earlier batched result of it will do.
+            # When the server is idle it gets the full decode instead, which then takes precedence.
+            batched_key = result_key(audio_digest, model_name, options, batched=True)
+            result = await cache.get_async(batched_key)
+            if result is not None:
+                key = batched_key
+        metrics.TRANSCRIPT_CACHE.inc(result="miss" if result is None else "hit")
+        if result is None:
+            result = await run_inference(source, model_name, options, progress)
+            if result["decode"].get("batched"):
+                # Kept under its own key, only looked up under load
+                key = result_key(audio_digest, model_name, options, batched=True)
+            await cache.put_async(key, result)
+        return key, result
     finally:
-        # Clean up the temporary file
-        os.unlink(temp_path)
+        _in_flight -= 1
+
+
+async def run_inference(source, model_name, options, progress=None):
+    # source is a path or file object; the audio is decoded here and transcribed in the worker pool
+    with metrics.stage("audio_decode"):
+        samples = await audio.decode(source)
+    duration = len(samples) / SAMPLE_RATE
+    classify(duration)
+    # Files decoded in pieces wait for room piece by piece rather than fail, so whether a request is taken at all is
+    # decided here, before any path is chosen
+    pool.check_admission()
+
+    started = time.perf_counter()
+    # Beam search is left out of batching: whisper's batched decode only works greedily
+    if batcher.enabled and len(samples) <= WINDOW_SAMPLES and not options["beam_size"]:
+        with metrics.stage("batch"):
+            result = await batcher.submit((model_name, tuple(sorted(options.items()))), samples)
+    elif duration > config.LONG_FILE_SECONDS:
+        # Long files are split at silences and the pieces transcribed in parallel
+        result = await transcribe_chunked(
+            samples,
+            lambda piece: pool.submit_waiting(transcribe_audio, model_name, piece, None, options),
+            pool.workers,
+            progress,
+        )
+    elif config.PREEMPT_SECONDS and duration > config.PREEMPT_SECONDS:
+        # Decoded in order in pieces of at most WHISPER_PREEMPT_SECONDS, so the worker is handed back between pieces;
+        # each piece is conditioned on the text before it and uses the language of the first
+        result = await transcribe_sequential(
+            samples, piece_decoder(model_name, options), progress, max_seconds=config.PREEMPT_SECONDS
+        )
+    else:
+        result = await pool.submit(transcribe_audio, model_name, samples, None, options)
+
+    metrics.record_decode(result["decode"])
+    if duration:
+        metrics.AUDIO_SECONDS.inc(duration)
+        metrics.REAL_TIME_FACTOR.observe((time.perf_counter() - started) / duration)
+    return result
+
+
+def piece_decoder(model_name, options):
+    # For stream_windows: one piece in the pool, with the language found so far unless the request named one
+    def decode(piece, prompt, language):
+        piece_options = {**options, "language": options["language"] or language}
+        return pool.submit_waiting(transcribe_audio, model_name, piece, prompt, piece_options)
+
+    return decode
+
+
+# Background tasks for running jobs, kept referenced so they aren't garbage collected
+_job_tasks = set()
+
+
+async def run_job(job_id, temp_path, audio_digest, options, filename=None):
+    try:
+        # Jobs wait their turn instead of being rejected when the pool is full
+        while True:
+            try:
+                jobs.store.update(job_id, status=jobs.RUNNING)
+                key, result = await transcribe_cached(
+                    temp_path, audio_digest, options, progress=lambda done: jobs.store.update(job_id, progress=done)
+                )
+                break
+            except PoolFull as e:
+                jobs.store.update(job_id, status=jobs.QUEUED)
+                await asyncio.sleep(e.retry_after)
+        jobs.store.set_result(job_id, result)
+        await archive(key, audio_digest, config.DEFAULT_MODEL, result, filename, options)
+    except Exception as e:
+        jobs.store.update(job_id, status=jobs.FAILED, error=str(e))
+    finally:
+        with metrics.stage("cleanup"):
+            os.unlink(temp_path)
+
+
+@app.post("/jobs", status_code=202)
+async def create_job(file: UploadFile = File(...), options: dict = Depends(decode_options),
+                     scheduling: tuple = Depends(request_class)):
+    hasher = hashlib.sha256()
+    temp_path = await save_upload(file, hasher=hasher)
+    job = jobs.store.create(file.filename)
+    # Nobody waits on a job's response, so unless the client asked otherwise it yields to everything else
+    priority, client = scheduling
+    schedule_as(priority or BULK, client)
+    task = asyncio.create_task(run_job(job["id"], temp_path, hasher.hexdigest(), options, file.filename))
+    _job_tasks.add(task)
+    task.add_done_callback(_job_tasks.discard)
+    return job
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = jobs.store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@app.get("/jobs/{job_id}/result", response_class=HTMLResponse)
+async def get_job_result(job_id: str, format: str = None, accept: str = Header(default="")):
+    job = await get_job(job_id)
+    if job["status"] == jobs.FAILED:
+        raise HTTPException(status_code=500, detail=job["error"])
+    if job["status"] != jobs.DONE:
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+    return render_result(jobs.store.get_result(job_id), format, accept)
+
+
+@app.websocket("/ws/transcribe")
+async def transcribe_live(websocket: WebSocket):
+    # Binary messages are float32 PCM frames; text messages are JSON control messages ("start", "stop").
+    # Decode options come from the query string and X-Client-Id like for uploads; ?session= identifies the browser
+    # tab, whose last detected language is reused so the re-decodes skip language detection.
+    await websocket.accept()
+    try:
+        options = decoding.resolve(websocket.headers.get("x-client-id", ""), websocket.query_params)
+    except ValueError as e:
+        await websocket.close(code=1008, reason=str(e))
+        return
+    session_id = websocket.query_params.get("session")
+    priority = websocket.headers.get("x-priority", INTERACTIVE)
+    schedule_as(priority if priority in PRIORITIES else INTERACTIVE,
+                websocket.headers.get("x-client-id") or (websocket.client.host if websocket.client else None))
+
+    async def decode(window, language):
+        result = await pool.submit(transcribe_segments, config.DEFAULT_MODEL, window, {**options, "language": language})
+        metrics.record_decode(result["decode"])
+        return result
+
+    session = LiveSession(decode, language=options["language"] or remembered_language(session_id))
+    # Everything said in the session, archived when the client stops it
+    hasher = hashlib.sha256()
+    segments = []
+
+    while True:
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            return
+
+        if message.get("bytes") is not None:
+            if len(message["bytes"]) % 4:
+                await websocket.close(code=1003, reason="Binary frames must be float32 PCM")
+                return
+            session.feed(message["bytes"])
+            hasher.update(message["bytes"])
+            if not session.ready():
+                continue
+            try:
+                final, partial = await session.update()
+            except PoolFull:
+                # Busy: skip this refresh, the audio stays buffered for the next one
+                continue
+            if not options["language"]:
+                remember_language(session_id, session.language)
+            segments.extend(final)
+            for segment in final:
+                await websocket.send_json({"type": "final", **segment})
+            await websocket.send_json({"type": "partial", "text": partial})
+            continue
+
+        try:
+            control = json.loads(message.get("text") or "{}")
+            if not isinstance(control, dict):
+                raise ValueError("not an object")
+            if control.get("type") == "start":
+                input_rate = int(control.get("sample_rate", session.input_rate))
+                if input_rate <= 0:
+                    raise ValueError("bad sample rate")
+        except (TypeError, ValueError):
+            await websocket.close(code=1007, reason="Text frames must be JSON control messages")
+            return
+        if control.get("type") == "start":
+            session.input_rate = input_rate
+        elif control.get("type") == "stop":
+            while True:
+                try:
+                    final = await session.finish()
+                    break
+                except PoolFull as e:
+                    await asyncio.sleep(e.retry_after)
+            segments.extend(final)
+            for segment in final:
+                await websocket.send_json({"type": "final", **segment})
+            if segments:
+                result = {
+                    "text": " ".join(segment["text"] for segment in segments),
+                    "language": session.language,
+                    "duration": segments[-1]["end"],
+                    "segments": segments,
+                }
+                await archive(uuid.uuid4().hex, hasher.hexdigest(), config.DEFAULT_MODEL, result, "live", options)
+            await websocket.send_json({"type": "done", "dropped_seconds": round(session.dropped_seconds, 2)})
+            await websocket.close()
+            return
+
+
+@app.get("/healthz")
+async def healthz():
+    # Liveness: the process is up and serving, whether or not the models are ready yet
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+async def readyz():
+    # Readiness: the preloaded models are loaded and have decoded once, so requests won't pay the cold start
+    if startup["error"]:
+        raise HTTPException(status_code=503, detail=f"Warm-up failed: {startup['error']}")
+    if not startup["ready"]:
+        raise HTTPException(status_code=503, detail="Warming up")
+    if not pool.ready():
+        raise HTTPException(status_code=503, detail="No inference worker is running")
+    return {"status": "ready", "models": config.PRELOAD_MODELS, "warm_up_seconds": startup["warm_up_seconds"]}
+
+
+@app.get("/models")
+async def models_status():
+    # Which models are resident (warm) and how much of the memory budget they use
+    return registry.status()
+
+
+@app.get("/pool")
+async def pool_status():
+    # Queue depth, busy workers and wait times, for sizing WHISPER_WORKERS / WHISPER_QUEUE_SIZE
+    return pool.stats()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    if not metrics.enabled:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/batcher")
+async def batcher_status():
+    # Average batch size shows whether WHISPER_BATCH_WAIT_MS is long enough to collect concurrent clips
+    return batcher.stats()
+
+
+def require_admin(x_admin_token: str = Header(default="")):
+    if config.ADMIN_TOKEN and x_admin_token != config.ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+
+@app.get("/cache")
+async def cache_status():
+    return cache.stats()
+
+
+@app.delete("/cache", dependencies=[Depends(require_admin)])
+async def purge_cache():
+    return {"removed": await asyncio.to_thread(cache.purge)}
@@ -0,0 +1,68 @@
+import io
+import struct
+
+import numpy as np
+import pytest
+
+import audio
+
+
+def wav(data, tag=1, channels=1, rate=16000, bits=16):
+    block = channels * max(bits // 8, 1)
+    fmt = struct.pack("<HHIIHH", tag, channels, rate, rate * block, block, bits)
+    body = b"WAVE" + b"fmt " + struct.pack("<I", len(fmt)) + fmt + b"data" + struct.pack("<I", len(data)) + data
+    return b"RIFF" + struct.pack("<I", len(body)) + body
+
+
+def test_parse_pcm16():
+    samples = np.array([0, 16384, -16384, 32767], dtype="<i2")
+    result = audio._parse_wav(io.BytesIO(wav(samples.tobytes())))
+    assert result.dtype == np.float32
+    np.testing.assert_allclose(result, samples / 32768)
+
+
+def test_parse_stereo_is_mixed_down():
+    samples = np.array([16384, 0, -16384, 0], dtype="<i2")
+    result = audio._parse_wav(io.BytesIO(wav(samples.tobytes(), channels=2)))
+    np.testing.assert_allclose(result, [0.25, -0.25])
+
+
+def test_parse_resamples_to_16k():
+    samples = np.zeros(48000, dtype="<f4")
+    result = audio._parse_wav(io.BytesIO(wav(samples.tobytes(), tag=3, rate=48000, bits=32)))
+    assert len(result) == 16000
+
+
+def test_parse_drops_trailing_partial_sample():
+    result = audio._parse_wav(io.BytesIO(wav(np.zeros(4, dtype="<i2").tobytes() + b"\x01")))
+    assert len(result) == 4
+
+
+@pytest.mark.parametrize(
+    "header",
+    [
+        {"tag": 0x11, "bits": 4},  # IMA-ADPCM
+        {"tag": 7, "bits": 8},  # mu-law
+        {"tag": 1, "bits": 12},
+        {"channels": 0},
+        {"rate": 0},
+    ],
+)
+def test_parse_rejects_what_it_cannot_read(header):
+    with pytest.raises(audio.UnsupportedWav):
+        audio._parse_wav(io.BytesIO(wav(b"\x00" * 64, **header)))
+
+
+def test_parse_rejects_missing_data_chunk():
+    with pytest.raises(audio.UnsupportedWav):
+        audio._parse_wav(io.BytesIO(wav(b"")[:36]))
+
+
+def test_compressed_wav_falls_back_to_general_decoder(monkeypatch):
+    decoded = np.zeros(10, dtype=np.float32)
+    calls = []
+    monkeypatch.setattr(audio, "av", None)
+    monkeypatch.setattr(audio, "_decode_with_ffmpeg", lambda source: calls.append(source) or decoded)
+    source = io.BytesIO(wav(b"\x00" * 64, tag=0x11, bits=4))
+    assert audio.load_audio(source) is decoded
+    assert calls == [source]
@@ -0,0 +1,221 @@
+# Archive of every transcript the service has produced, with full-text search over segment text.
+# One SQLite file (WAL): a row per transcript, a row per segment with times in milliseconds, and an FTS5 index over
+# the segment text that reads the segments table instead of keeping a second copy of it.
+# Lists and searches are paged newest first with a "before" cursor, so a page costs the same however large the
+# archive gets.
+
+import json
+import sqlite3
+import threading
+import time
+
+import config
+
+MAX_PAGE = 500
+PREVIEW_CHARS = 200
+
+
+class TranscriptStore:
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS transcripts (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    id TEXT NOT NULL UNIQUE,
+                    audio_hash TEXT,
+                    model TEXT NOT NULL,
+                    filename TEXT,
+                    language TEXT,
+                    duration REAL,
+                    text TEXT NOT NULL,
+                    options TEXT,
+                    created_at REAL NOT NULL
+                )"""
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS transcripts_audio_hash ON transcripts (audio_hash)")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS segments (
+                    id INTEGER PRIMARY KEY,
+                    transcript_seq INTEGER NOT NULL REFERENCES transcripts (seq),
+                    start_ms INTEGER NOT NULL,
+                    end_ms INTEGER NOT NULL,
+                    text TEXT NOT NULL
+                )"""
+            )
+            # Indexed entries of one transcript are in row id order, which is the order segments are paged in
+            self._conn.execute("DROP INDEX IF EXISTS segments_transcript")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS segments_by_transcript ON segments (transcript_seq)")
+            self._conn.execute(
+                """CREATE VIRTUAL TABLE IF NOT EXISTS segments_fts
+                USING fts5(text, content='segments', content_rowid='id')"""
+            )
+
+    def save(self, transcript_id, audio_hash, model, result, filename=None, options=None):
+        # Idempotent: the id is the cache key, so saving the same transcript again is a no-op
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                """INSERT OR IGNORE INTO transcripts
+                (id, audio_hash, model, filename, language, duration, text, options, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (
+                    transcript_id, audio_hash, model, filename, result.get("language"), result.get("duration"),
+                    result["text"], json.dumps(options) if options else None, time.time(),
+                ),
+            )
+            if not cursor.rowcount:
+                return False
+            seq = cursor.lastrowid
+            for segment in result["segments"]:
+                cursor = self._conn.execute(
+                    "INSERT INTO segments (transcript_seq, start_ms, end_ms, text) VALUES (?, ?, ?, ?)",
+                    (seq, _ms(segment["start"]), _ms(segment["end"]), segment["text"].strip()),
+                )
+                self._conn.execute(
+                    "INSERT INTO segments_fts (rowid, text) VALUES (?, ?)", (cursor.lastrowid, segment["text"].strip())
+                )
+        return True
+
+    def get(self, transcript_id):
+        # The stored result in the format of formats.py (without word timings), or None
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM transcripts WHERE id = ?", (transcript_id,)).fetchone()
+            if row is None:
+                return None
+            segments = self._conn.execute(
+                "SELECT start_ms, end_ms, text FROM segments WHERE transcript_seq = ? ORDER BY id",
+                (row["seq"],),
+            ).fetchall()
+        return {
+            "text": row["text"],
+            "language": row["language"],
+            "duration": row["duration"],
+            "segments": [
+                {"start": s["start_ms"] / 1000, "end": s["end_ms"] / 1000, "text": s["text"]} for s in segments
+            ],
+        }
+
+    def recent(self, limit=50, before=None, model=None, audio_hash=None):
+        # Newest first; pass the returned "next" as `before` for the following page
+        where, params = self._filters(before, model, audio_hash, seq_column="seq")
+        limit = _page_size(limit)
+        with self._lock:
+            rows = self._conn.execute(
+                f"""SELECT seq, id, audio_hash, model, filename, language, duration, created_at,
+                substr(text, 1, {PREVIEW_CHARS}) AS preview
+                FROM transcripts {where} ORDER BY seq DESC LIMIT ?""",
+                (*params, limit + 1),
+            ).fetchall()
+        return _page([_transcript(row) for row in rows], rows, limit)
+
+    def segments(self, transcript_id, limit=100, after=None):
+        # One transcript's segments in order, or None for an unknown transcript; pass the returned "next" as `after`
+        # for the following page. Segments are saved in order, so their row id orders them and, unlike the start
+        # time (several segments can start at the same moment), never ties.
+        limit = _page_size(limit)
+        with self._lock:
+            row = self._conn.execute("SELECT seq FROM transcripts WHERE id = ?", (transcript_id,)).fetchone()
+            if row is None:
+                return None
+            rows = self._conn.execute(
+                """SELECT id AS seq, start_ms, end_ms, text FROM segments
+                WHERE transcript_seq = ? AND id > ? ORDER BY id LIMIT ?""",
+                (row["seq"], after or 0, limit + 1),
+            ).fetchall()
+        items = [{"start_ms": row["start_ms"], "end_ms": row["end_ms"], "text": row["text"]} for row in rows]
+        return _page(items, rows, limit)
+
+    def search(self, query, limit=50, before=None, model=None, audio_hash=None):
+        # Segments whose text contains all the words of the query (a trailing * matches a prefix), newest first
+        match = _match_expression(query)
+        if not match:
+            raise ValueError("Empty search query")
+        where, params = self._filters(before, model, audio_hash, seq_column="segments_fts.rowid", prefix="AND")
+        limit = _page_size(limit)
+        with self._lock:
+            rows = self._conn.execute(
+                f"""SELECT segments_fts.rowid AS seq, s.start_ms, s.end_ms, s.text,
+                t.id, t.audio_hash, t.model, t.filename, t.language, t.created_at
+                FROM segments_fts
+                JOIN segments s ON s.id = segments_fts.rowid
+                JOIN transcripts t ON t.seq = s.transcript_seq
+                WHERE segments_fts MATCH ? {where}
+                ORDER BY segments_fts.rowid DESC LIMIT ?""",
+                (match, *params, limit + 1),
+            ).fetchall()
+        items = [
+            {
+                "transcript_id": row["id"],
+                "start_ms": row["start_ms"],
+                "end_ms": row["end_ms"],
+                "text": row["text"],
+                "audio_hash": row["audio_hash"],
+                "model": row["model"],
+                "filename": row["filename"],
+                "language": row["language"],
+                "created_at": row["created_at"],
+            }
+            for row in rows[:limit]
+        ]
+        return _page(items, rows, limit)
+
+    def _filters(self, before, model, audio_hash, seq_column, prefix="WHERE"):
+        clauses, params = [], []
+        if before is not None:
+            clauses.append(f"{seq_column} < ?")
+            params.append(before)
+        if model:
+            clauses.append("model = ?")
+            params.append(model)
+        if audio_hash:
+            clauses.append("audio_hash = ?")
+            params.append(audio_hash)
+        return (f"{prefix} " + " AND ".join(clauses) if clauses else ""), params
+
+
+def _ms(seconds):
+    return int(round(seconds * 1000))
+
+
+def _page_size(limit):
+    return max(1, min(int(limit), MAX_PAGE))
+
+
+def _page(items, rows, limit):
+    # One row beyond the page was fetched to tell whether there is a next page
+    return {"items": items[:limit], "next": rows[limit - 1]["seq"] if len(rows) > limit else None}
+
+
+def _transcript(row):
+    return {
+        "id": row["id"],
+        "audio_hash": row["audio_hash"],
+        "model": row["model"],
+        "filename": row["filename"],
+        "language": row["language"],
+        "duration": row["duration"],
+        "created_at": row["created_at"],
+        "preview": row["preview"],
+    }
+
+
+def _match_expression(query):
+    # Every word quoted, so punctuation and FTS5 operators in user input are matched literally
+    terms = []
+    for word in query.split():
+        prefix = word.endswith("*")
+        word = word.rstrip("*").replace('"', '""')
+        if word:
+            terms.append(f'"{word}"' + ("*" if prefix else ""))
+    return " ".join(terms)
+
+
+def create_store(path=config.TRANSCRIPT_DB_PATH):
+    # An empty path turns the archive off
+    return TranscriptStore(path) if path else None
+
+
+store = create_store()
@@ -0,0 +1,84 @@
+# Upload ingestion: enforce the size limit while the body streams in and read it in chunks,
+# so no request ever holds the whole file in memory.
+
+import os
+import tempfile
+
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+
+import config
+import metrics
+
+
+def _too_large(max_bytes):
+    return HTTPException(status_code=413, detail=f"Upload exceeds the {max_bytes // (1024 * 1024)} MB limit")
+
+
+class UploadLimitMiddleware:
+    # Plain ASGI middleware: it sees the body before FastAPI parses the form
+    def __init__(self, app, max_bytes=config.MAX_UPLOAD_MB * 1024 * 1024):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.max_bytes:
+            return await self.app(scope, receive, send)
+
+        # Honest clients announce the size, so most oversized uploads stop here unread
+        length = dict(scope["headers"]).get(b"content-length")
+        if length is not None and int(length) > self.max_bytes:
+            await send({
+                "type": "http.response.start",
+                "status": 413,
+                "headers": [(b"content-type", b"text/plain"), (b"connection", b"close")],
+            })
+            await send({"type": "http.response.body", "body": b"Upload too large"})
+            return
+
+        # Chunked or lying clients are cut off as soon as they cross the limit
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    raise _too_large(self.max_bytes)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+async def hash_upload(file, hasher, chunk_size=config.UPLOAD_CHUNK_BYTES):
+    # One chunked pass over the spooled upload for its digest, then rewind so it can be decoded in place
+    while True:
+        with metrics.stage("upload_read"):
+            chunk = await file.read(chunk_size)
+        if not chunk:
+            break
+        hasher.update(chunk)
+    await file.seek(0)
+
+
+async def save_upload(file, chunk_size=config.UPLOAD_CHUNK_BYTES, hasher=None):
+    # Copy the upload to a temporary file one chunk at a time, for work that outlives the request (jobs);
+    # the caller removes it when done.
+    # A hasher (e.g. hashlib.sha256()) is fed the same chunks, so the digest costs no extra pass.
+    temp_file = tempfile.NamedTemporaryFile(delete=False)
+    try:
+        with temp_file:
+            while True:
+                with metrics.stage("upload_read"):
+                    chunk = await file.read(chunk_size)
+                if not chunk:
+                    break
+                if hasher is not None:
+                    hasher.update(chunk)
+                with metrics.stage("temp_write"):
+                    await run_in_threadpool(temp_file.write, chunk)
+    except BaseException:
+        os.unlink(temp_file.name)
+        raise
+    return temp_file.name
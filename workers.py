@@ -0,0 +1,235 @@
+# Bounded pool that runs blocking Whisper inference off the event loop.
+# Admission is checked up front so callers over capacity fail fast instead of piling up.
+# Free workers go to the waiting task of the highest priority class, taking turns between clients within a class.
+
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import asyncio
+import contextvars
+import math
+import time
+
+import config
+import metrics
+from taskqueue import QueueExecutor, TaskQueue
+
+
+INTERACTIVE = "interactive"
+NORMAL = "normal"
+BULK = "bulk"
+PRIORITIES = (INTERACTIVE, NORMAL, BULK)  # served in this order
+
+# Who the current request's inference runs for: (priority class or None to decide by duration, client).
+# Set once per request; tasks the request starts (pieces of a long file, jobs) inherit it.
+_request_class = contextvars.ContextVar("request_class", default=(None, None))
+
+
+def schedule_as(priority=None, client=None):
+    _request_class.set((priority, client))
+
+
+def classify(duration):
+    # Once the audio length is known: keep the class the request named, or pick one by length (voice notes are
+    # interactive, multi-minute uploads bulk)
+    priority, client = _request_class.get()
+    if priority is None:
+        if duration <= config.INTERACTIVE_SECONDS:
+            priority = INTERACTIVE
+        elif duration > config.BULK_SECONDS:
+            priority = BULK
+        else:
+            priority = NORMAL
+        _request_class.set((priority, client))
+    return priority
+
+
+class PoolFull(Exception):
+    def __init__(self, retry_after):
+        super().__init__("Inference queue is full")
+        self.retry_after = retry_after
+
+
+class FairScheduler:
+    # Worker slots for the pool. A waiter of a higher priority class always goes first; within a class clients take
+    # turns, so the many window-sized pieces of one client's long file don't hold up another client's single one.
+    def __init__(self, slots):
+        self._free = slots
+        self._waiting = {priority: OrderedDict() for priority in PRIORITIES}  # client -> deque of futures
+
+    async def acquire(self, priority, client):
+        if self._free and not any(self._waiting.values()):
+            self._free -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._waiting[priority].setdefault(client, deque()).append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Handed a slot just as the caller went away: pass it on
+                self.release()
+            else:
+                self._discard(priority, client, future)
+            raise
+
+    def release(self):
+        for clients in self._waiting.values():
+            while clients:
+                client, futures = next(iter(clients.items()))
+                future = futures.popleft()
+                if futures:
+                    clients.move_to_end(client)
+                else:
+                    del clients[client]
+                # Skip waiters that were cancelled but haven't cleaned up yet
+                if not future.done():
+                    future.set_result(None)
+                    return
+        self._free += 1
+
+    def queued(self):
+        return {priority: sum(map(len, clients.values())) for priority, clients in self._waiting.items()}
+
+    def _discard(self, priority, client, future):
+        futures = self._waiting[priority].get(client)
+        if futures is not None and future in futures:
+            futures.remove(future)
+            if not futures:
+                del self._waiting[priority][client]
+
+
+class InferencePool:
+    def __init__(self, kind=config.POOL_KIND, workers=config.POOL_WORKERS, queue_size=config.QUEUE_SIZE,
+                 interactive_reserve=config.INTERACTIVE_RESERVE):
+        if kind not in ("thread", "process", "queue"):
+            raise ValueError(f"Unknown pool kind: {kind}")
+        self.kind = kind
+        self.workers = workers
+        self.queue_size = queue_size
+        self.interactive_reserve = min(interactive_reserve, queue_size)
+        self._executor = None
+        self._slots = None
+        self._queued = 0
+        self._active = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._run_total = 0.0
+
+    def start(self):
+        if self._slots is None:
+            # The executor never sees more than one job per worker; everything else waits here
+            self._slots = FairScheduler(self.workers)
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            elif self.kind == "queue":
+                self._executor = QueueExecutor(TaskQueue())
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="whisper")
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def check_admission(self, priority=None):
+        # Raises PoolFull when no more work of this class can be queued right now. Other classes leave the last few
+        # places to interactive requests; a request whose class isn't known yet is checked against the full queue.
+        if not self._has_room(priority or _request_class.get()[0]):
+            self._rejected += 1
+            raise PoolFull(self._retry_after())
+
+    async def submit(self, fn, *args):
+        self.check_admission(_request_class.get()[0] or NORMAL)
+        return await self._run(fn, args)
+
+    async def submit_waiting(self, fn, *args):
+        # For work that has already been accepted (e.g. pieces of one long file): wait for room instead of failing.
+        # Not counted as rejections; the request itself went through check_admission.
+        while not self._has_room(_request_class.get()[0] or NORMAL):
+            await asyncio.sleep(min(self._retry_after(), 1))
+        return await self._run(fn, args)
+
+    def _has_room(self, priority):
+        limit = self.workers + self.queue_size
+        if priority not in (None, INTERACTIVE):
+            limit -= self.interactive_reserve
+        return self._queued + self._active < limit
+
+    async def _run(self, fn, args):
+        # All bookkeeping happens on the event loop thread, so no lock is needed
+        priority, client = _request_class.get()
+        priority = priority or NORMAL
+        self.start()
+        submitted = time.perf_counter()
+        self._queued += 1
+        try:
+            await self._slots.acquire(priority, client)
+        finally:
+            self._queued -= 1
+
+        started = time.perf_counter()
+        wait = started - submitted
+        self._wait_total += wait
+        self._wait_max = max(self._wait_max, wait)
+        metrics.QUEUE_WAIT_SECONDS.observe(wait, priority=priority)
+        metrics.record_stage("queue", wait)
+        self._active += 1
+        try:
+            if self.kind == "thread":
+                # Carry the request's context into the worker so stages timed there (model_load) are reported
+                fn, args = contextvars.copy_context().run, (fn, *args)
+            result = await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        except BaseException:
+            self._failed += 1
+            raise
+        else:
+            run = time.perf_counter() - started
+            self._completed += 1
+            self._run_total += run
+            metrics.record_stage("inference", run)
+            return result
+        finally:
+            self._active -= 1
+            self._slots.release()
+
+    def ready(self):
+        # In multi-process mode requests can only be served once some inference worker is up
+        return self.kind != "queue" or (self._executor is not None and self._executor.queue.live_workers() > 0)
+
+    def stats(self):
+        started = self._completed + self._failed + self._active
+        stats = {
+            "kind": self.kind,
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "interactive_reserve": self.interactive_reserve,
+            "active": self._active,
+            "queued": self._queued,
+            "queued_by_priority": self._slots.queued() if self._slots is not None else {},
+            "completed": self._completed,
+            "failed": self._failed,
+            "rejected": self._rejected,
+            "avg_wait_seconds": round(self._wait_total / started, 3) if started else 0.0,
+            "max_wait_seconds": round(self._wait_max, 3),
+            "avg_run_seconds": round(self._run_total / self._completed, 3) if self._completed else 0.0,
+        }
+        if self.kind == "queue" and self._executor is not None:
+            # Shared by all front-ends
+            stats["shared_queue"] = self._executor.queue.stats()
+        return stats
+
+    def _retry_after(self):
+        # Rough estimate of when a slot frees up, from the average service time so far
+        avg_run = self._run_total / self._completed if self._completed else 1.0
+        backlog = (self._queued + self._active) / max(1, self.workers)
+        return max(1, math.ceil(avg_run * backlog))
+
+
+pool = InferencePool()
+
+metrics.Gauge("whisper_pool_queued", "Requests waiting for an inference worker", lambda: pool._queued)
+metrics.Gauge("whisper_pool_active", "Inference workers currently busy", lambda: pool._active)